@@ -1,25 +1,142 @@
 #!flask/bin/python
-import six
-import sys
-from flask import Flask, jsonify, abort, request, make_response, url_for
-from flask_httpauth import HTTPBasicAuth
-from database import DatabaseHelper, TestDB
+import os
+import threading
+from flask import Flask, Response, g, jsonify, abort, request, make_response, \
+    after_this_request, stream_with_context, url_for
+from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth, MultiAuth
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
+from compression import Compressor
+from connection import pool_statistics
+from kdf import KDFOverloadedError
+from metrics import metrics
+from ratelimit import IP_RATE_LIMIT_ENABLED, RATE_LIMIT_ENABLED, \
+    TRUSTED_PROXIES, Limiter, OverloadedError, RateLimitedError, \
+    bucket_store_from_env
+from responses import add_validators, as_utc, is_not_modified, \
+    representation_tag, vary_on_accept, wants_stream
+from serialization import FastJSONProvider, public_task, public_tasks
+from storage import STORAGE_BACKEND, TASK_ID_BLOCK_SIZE, VersionConflictError, \
+    create_storage
+from tokens import TokenSigner
+from validation import TASK_FIELDS, Int64Converter, parse_batch, \
+    parse_listing_args, valid_task_update
 
 app = Flask(__name__, static_url_path="")
-auth = HTTPBasicAuth()
+app.url_map.converters['int'] = Int64Converter
+_wsgi_app = app.wsgi_app
+app.json = FastJSONProvider(app)
+basic_auth = HTTPBasicAuth()
+token_auth = HTTPTokenAuth(scheme='Bearer')
+auth = MultiAuth(basic_auth, token_auth)
+tokens = TokenSigner()
 
-if "app.py" == sys.argv[0]:
-    db = DatabaseHelper()
-else:
-    db = TestDB()  # if running unit tests
+STREAM_BATCH_SIZE = 500
+# requests per second and burst per user for routes that cost more than a read
+TOKEN_RATE_LIMIT = (1, 5)
+BATCH_RATE_LIMIT = (2, 10)
 
+# the unit tests opt in to this with create_app(TEST_CONFIG); importing the
+# module alone configures the app from the environment, as a server would
+TEST_CONFIG = {
+    'STORAGE_BACKEND': 'test',
+    'STORAGE_OPTIONS': {},
+    'RATE_LIMIT_ENABLED': False,
+    'IP_RATE_LIMIT_ENABLED': False,
+    'TRUSTED_PROXIES': 0,
+}
 
-@auth.verify_password
+
+def config_from_env():
+    return {
+        'STORAGE_BACKEND': STORAGE_BACKEND,
+        'STORAGE_OPTIONS': {'database_name':
+                            os.environ.get('MONGO_DATABASE', 'production'),
+                            'id_block_size': TASK_ID_BLOCK_SIZE},
+        'RATE_LIMIT_ENABLED': RATE_LIMIT_ENABLED,
+        'IP_RATE_LIMIT_ENABLED': IP_RATE_LIMIT_ENABLED,
+        'TRUSTED_PROXIES': TRUSTED_PROXIES,
+    }
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    # created on first use: a server that preloads the app forks before any
+    # Mongo client, index build or KDF thread exists
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                storage = create_storage(app.config['STORAGE_BACKEND'],
+                                         **app.config['STORAGE_OPTIONS'])
+                if storage.task_cache is not None:
+                    storage.listen_for_task_changes(app.logger)
+                _storage = storage
+    return _storage
+
+
+def create_app(config=None):
+    # not a factory: there is one app per process, and the routes, limiter and
+    # metrics below are bound to it. A call reconfigures that app and drops
+    # the storage, so the last call wins. Importing this module already
+    # configures it from the environment; only tests and benchmarks call this
+    # again, to switch to their own config
+    global _storage
+    app.config.update(config or {})
+    # client addresses come from X-Forwarded-For set by that many proxies
+    proxies = app.config.get('TRUSTED_PROXIES', 0)
+    app.wsgi_app = ProxyFix(_wsgi_app, x_for=proxies) if proxies else _wsgi_app
+    with _storage_lock:
+        _storage = None
+    return app
+
+
+db = LocalProxy(get_storage)
+create_app(config_from_env())
+metrics.init_app(app)
+limiter = Limiter(auth.current_user, bucket_store_from_env())
+limiter.init_app(app)
+compressor = Compressor()
+compressor.init_app(app)
+
+
+def collect_statistics():
+    statistics = []
+    for prefix, values in (('mongo_pool', pool_statistics.as_dict()),
+                           ('kdf', db.kdf.statistics()),
+                           ('admission', limiter.statistics()),
+                           ('compression', compressor.statistics())):
+        for name, value in sorted(values.items()):
+            statistics.append(('todo_%s_%s' % (prefix, name),
+                               '%s %s.' % (prefix, name.replace('_', ' ')), value))
+    for name, cache in (('credential', db.verified_credentials),
+                        ('task', db.task_cache)):
+        if cache is not None:
+            statistics.append(('todo_%s_cache_hit_ratio' % name,
+                               'Hit ratio of the %s cache.' % name, cache.hit_rate()))
+    return statistics
+
+
+metrics.add_collector(collect_statistics)
+
+
+@basic_auth.verify_password
 def verify_password(username, password):
-    return db.check_password_hash_for_user(username, password)
+    if db.check_password_hash_for_user(username, password):
+        return username
+
 
+@token_auth.verify_token
+def verify_token(token):
+    # signature and expiry only: no database lookup and no bcrypt
+    return tokens.verify(token)
 
-@auth.error_handler
+
+@basic_auth.error_handler
+@token_auth.error_handler
 def unauthorized():
     # return 403 instead of 401 to prevent browsers from displaying the default
     # auth dialog
@@ -36,89 +153,195 @@ def not_found(error):
     return make_response(jsonify({'error': 'Not found'}), 404)
 
 
+@app.errorhandler(409)
+def conflict(error):
+    return make_response(jsonify({'error': 'Conflict'}), 409)
+
+
+@app.errorhandler(KDFOverloadedError)
+def overloaded(error):
+    response = make_response(jsonify({'error': 'Service unavailable'}), 503)
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@app.errorhandler(RateLimitedError)
+def rate_limited(error):
+    response = make_response(jsonify({'error': 'Too many requests'}), 429)
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@app.errorhandler(OverloadedError)
+def shed(error):
+    response = make_response(jsonify({'error': 'Service unavailable'}), 503)
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
 def make_public_task(task):
-    new_task = {}
-    for field in task:
-        if field == 'id':
-            new_task['uri'] = url_for('get_task', task_id=task['id'],
-                                      _external=True)
-        else:
-            new_task[field] = task[field]
-    return new_task
+    return public_task(task, task_uri_prefix())
+
+
+def task_uri_prefix():
+    # a task's uri is the listing uri plus its id, so url_for runs once per
+    # request instead of once per task
+    if 'task_uri_prefix' not in g:
+        g.task_uri_prefix = url_for('get_tasks', _external=True) + '/'
+    return g.task_uri_prefix
+
+
+def not_modified(etag, last_modified):
+    if not is_not_modified(request, etag, last_modified):
+        return None
+    return add_validators(make_response('', 304), etag, last_modified)
+
+
+def stream_tasks(listing):
+    tasks = db.retrieve_tasks(batch_size=STREAM_BATCH_SIZE, **listing)
+    uri_prefix = task_uri_prefix()
+
+    def generate():
+        for task in tasks:
+            yield app.json.dumps(public_task(task, uri_prefix)) + '\n'
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/x-ndjson')
+
+
+@app.route('/todo/api/v1.0/tokens', methods=['POST'])
+@basic_auth.login_required
+@limiter.limit(*TOKEN_RATE_LIMIT)
+def create_token():
+    return jsonify({'token': tokens.sign(basic_auth.current_user()),
+                    'expires_in': tokens.expiration}), 201
 
 
 @app.route('/todo/api/v1.0/tasks', methods=['GET'])
 @auth.login_required
+@limiter.limit()
 def get_tasks():
-    tasks = db.retrieve_tasks()
-    return jsonify({'tasks': [make_public_task(task) for task in tasks]})
+    after_this_request(vary_on_accept)
+    listing = parse_listing_args(request.args)
+    changes, last_modified = db.retrieve_task_changes()
+    last_modified = as_utc(last_modified)
+    # the representation depends on the host and query string, so they are
+    # part of the tag
+    etag = '%d-%s' % (changes, representation_tag(request, request.query_string))
+    if wants_stream(request):
+        etag += '-ndjson'
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    if wants_stream(request):
+        return add_validators(stream_tasks(listing), etag, last_modified)
+    limit = listing.get('limit')
+    if limit is not None:
+        # fetch one extra task to find out whether there is a next page
+        listing['limit'] = limit + 1
+    tasks = list(db.retrieve_tasks(**listing))
+    response = {}
+    if limit is not None and len(tasks) > limit:
+        tasks = tasks[:limit]
+        args = request.args.to_dict()
+        args['after'] = tasks[-1]['id']
+        response['next'] = url_for('get_tasks', _external=True, **args)
+    response['tasks'] = public_tasks(tasks, task_uri_prefix())
+    return add_validators(jsonify(response), etag, last_modified)
+
+
+@app.route('/todo/api/v1.0/tasks/stats', methods=['GET'])
+@auth.login_required
+@limiter.limit()
+def get_task_stats():
+    return jsonify({'stats': db.retrieve_task_stats()})
 
 
 @app.route('/todo/api/v1.0/tasks/<int:task_id>', methods=['GET'])
 @auth.login_required
+@limiter.limit()
 def get_task(task_id):
-    tasks = db.retrieve_tasks()
-    task = [task for task in tasks if task['id'] == task_id]
-    if len(task) == 0:
+    task = db.retrieve_task_with_id(task_id)
+    if task is None:
         abort(404)
-    return jsonify({'task': make_public_task(task[0])})
+    etag = '%d-%d-%s' % (task_id, task.get('version', 0),
+                            representation_tag(request))
+    last_modified = as_utc(task.get('updated_at'))
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    return add_validators(jsonify({'task': make_public_task(task)}),
+                          etag, last_modified)
 
 
 @app.route('/todo/api/v1.0/tasks', methods=['POST'])
 @auth.login_required
+@limiter.limit()
 def create_task():
-    tasks_list = []
-    tasks = db.retrieve_tasks()
-    for task in tasks:
-        tasks_list.append(task)
     if not request.json or 'title' not in request.json:
         abort(400)
     task = {
-        'id': tasks_list[-1]['id'] + 1,
         'title': request.json['title'],
         'description': request.json.get('description', ""),
         'done': False
     }
-    db.add_task_to_db(task)
-    task = db.retrieve_task_with_title(request.json['title'])
+    task = db.insert_new_task(task)
     return jsonify({'task': make_public_task(task)}), 201
 
 
+@app.route('/todo/api/v1.0/tasks:batch', methods=['POST'])
+@auth.login_required
+@limiter.limit(*BATCH_RATE_LIMIT)
+def batch_tasks():
+    operations, ordered = parse_batch(request.json)
+    results = db.apply_task_operations(operations, ordered)
+    for result in results:
+        if 'task' in result:
+            result['task'] = make_public_task(result['task'])
+    return jsonify({'results': results})
+
+
 @app.route('/todo/api/v1.0/tasks/<int:task_id>', methods=['PUT'])
 @auth.login_required
+@limiter.limit()
 def update_task(task_id):
-    tasks = db.retrieve_tasks()
-    task = [task for task in tasks if task['id'] == task_id]
-    if len(task) == 0:
-        abort(404)
-    if not request.json:
-        abort(400)
-    if 'title' in request.json and \
-            not isinstance(request.json['title'], six.string_types):
-        abort(400)
-    if 'description' in request.json and \
-            not isinstance(request.json['description'], six.string_types):
+    if not request.json or not valid_task_update(request.json):
         abort(400)
-    if 'done' in request.json and type(request.json['done']) is not bool:
-        abort(400)
-    task[0]['title'] = request.json.get('title', task[0]['title'])
-    task[0]['description'] = request.json.get('description',
-                                              task[0]['description'])
-    task[0]['done'] = request.json.get('done', task[0]['done'])
-    db.find_and_update_task(task[0])
-    return jsonify({'task': make_public_task(task[0])})
+    changes = dict((field, request.json[field])
+                   for field in TASK_FIELDS if field in request.json)
+    try:
+        task = db.update_task_fields(task_id, changes,
+                                     request.json.get('version'))
+    except VersionConflictError:
+        abort(409)
+    if task is None:
+        abort(404)
+    return jsonify({'task': make_public_task(task)})
 
 
 @app.route('/todo/api/v1.0/tasks/<int:task_id>', methods=['DELETE'])
 @auth.login_required
+@limiter.limit()
 def delete_task(task_id):
-    tasks = db.retrieve_tasks()
-    task = [task for task in tasks if task['id'] == task_id]
-    if len(task) == 0:
+    if not db.remove_task_by_id(task_id):
         abort(404)
-    db.remove_task(task[0])
     return jsonify({'result': True})
 
 
+@app.route('/healthz', methods=['GET'])
+@limiter.exempt
+def health():
+    # the process is up and serving; says nothing about the database
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz', methods=['GET'])
+@limiter.exempt
+def ready():
+    if not db.ping():
+        return make_response(jsonify({'status': 'unavailable'}), 503)
+    return jsonify({'status': 'ready'})
+
+
 if __name__ == '__main__':
     app.run(debug=True)
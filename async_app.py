@@ -0,0 +1,244 @@
+# run instructions: pip install quart motor hypercorn
+# cd /restful_api_with_mongo_db
+# hypercorn async_app:app
+
+import functools
+import os
+
+from quart import Quart, Response, abort, after_this_request, g, jsonify, \
+    make_response, request, stream_with_context, url_for
+
+from async_database import AsyncDatabaseHelper
+from kdf import KDFOverloadedError
+from responses import add_validators, as_utc, is_not_modified, \
+    representation_tag, vary_on_accept, wants_stream
+from serialization import dumps, public_task, public_tasks
+from storage import VersionConflictError
+from tokens import TokenSigner
+from validation import TASK_FIELDS, Int64Converter, parse_batch, \
+    parse_listing_args, valid_task_update
+
+STREAM_BATCH_SIZE = 500
+
+app = Quart(__name__, static_url_path="")
+app.url_map.converters['int'] = Int64Converter
+db = AsyncDatabaseHelper(os.environ.get('MONGO_DATABASE', 'production'))
+tokens = TokenSigner()
+
+
+@app.before_serving
+async def create_indexes():
+    await db.create_indexes()
+
+
+async def authenticate(schemes):
+    credentials = request.authorization
+    if credentials is None or credentials.type not in schemes:
+        return None
+    if credentials.type == 'bearer':
+        # signature and expiry only: no database lookup and no bcrypt
+        return tokens.verify(credentials.token)
+    if await db.check_password_hash_for_user(credentials.username,
+                                             credentials.password):
+        return credentials.username
+
+
+def requires_auth(*schemes):
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            g.user = await authenticate(schemes)
+            if g.user is None:
+                return await unauthorized()
+            return await view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+login_required = requires_auth('basic', 'bearer')
+basic_login_required = requires_auth('basic')
+
+
+async def unauthorized():
+    # return 403 instead of 401 to prevent browsers from displaying the default
+    # auth dialog
+    return await make_response(jsonify({'error': 'Unauthorized access'}), 403)
+
+
+@app.errorhandler(400)
+async def bad_request(error):
+    return await make_response(jsonify({'error': 'Bad request'}), 400)
+
+
+@app.errorhandler(404)
+async def not_found(error):
+    return await make_response(jsonify({'error': 'Not found'}), 404)
+
+
+@app.errorhandler(409)
+async def conflict(error):
+    return await make_response(jsonify({'error': 'Conflict'}), 409)
+
+
+@app.errorhandler(KDFOverloadedError)
+async def overloaded(error):
+    response = await make_response(jsonify({'error': 'Service unavailable'}), 503)
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def make_public_task(task):
+    return public_task(task, task_uri_prefix())
+
+
+def task_uri_prefix():
+    if 'task_uri_prefix' not in g:
+        g.task_uri_prefix = url_for('get_tasks', _external=True) + '/'
+    return g.task_uri_prefix
+
+
+async def not_modified(etag, last_modified):
+    if not is_not_modified(request, etag, last_modified):
+        return None
+    return add_validators(await make_response('', 304), etag, last_modified)
+
+
+async def stream_tasks(listing):
+    tasks = await db.retrieve_tasks(batch_size=STREAM_BATCH_SIZE, **listing)
+    uri_prefix = task_uri_prefix()
+
+    @stream_with_context
+    async def generate():
+        if isinstance(tasks, list):
+            # search results are ranked in full before they are sent
+            for task in tasks:
+                yield (dumps(public_task(task, uri_prefix)) + '\n').encode('utf-8')
+        else:
+            async for task in tasks:
+                yield (dumps(public_task(task, uri_prefix)) + '\n').encode('utf-8')
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/todo/api/v1.0/tokens', methods=['POST'])
+@basic_login_required
+async def create_token():
+    return jsonify({'token': tokens.sign(g.user),
+                    'expires_in': tokens.expiration}), 201
+
+
+@app.route('/todo/api/v1.0/tasks', methods=['GET'])
+@login_required
+async def get_tasks():
+    after_this_request(vary_on_accept)
+    listing = parse_listing_args(request.args)
+    changes, last_modified = await db.retrieve_task_changes()
+    last_modified = as_utc(last_modified)
+    etag = '%d-%s' % (changes, representation_tag(request, request.query_string))
+    if wants_stream(request):
+        etag += '-ndjson'
+    response = await not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    if wants_stream(request):
+        return add_validators(await stream_tasks(listing), etag, last_modified)
+    limit = listing.get('limit')
+    if limit is not None:
+        listing['limit'] = limit + 1
+    tasks = await db.retrieve_tasks(**listing)
+    if not isinstance(tasks, list):
+        tasks = await tasks.to_list(None)
+    response = {}
+    if limit is not None and len(tasks) > limit:
+        tasks = tasks[:limit]
+        args = request.args.to_dict()
+        args['after'] = tasks[-1]['id']
+        response['next'] = url_for('get_tasks', _external=True, **args)
+    response['tasks'] = public_tasks(tasks, task_uri_prefix())
+    return add_validators(jsonify(response), etag, last_modified)
+
+
+@app.route('/todo/api/v1.0/tasks/stats', methods=['GET'])
+@login_required
+async def get_task_stats():
+    return jsonify({'stats': await db.retrieve_task_stats()})
+
+
+@app.route('/todo/api/v1.0/tasks/<int:task_id>', methods=['GET'])
+@login_required
+async def get_task(task_id):
+    task = await db.retrieve_task_with_id(task_id)
+    if task is None:
+        abort(404)
+    etag = '%d-%d-%s' % (task_id, task.get('version', 0),
+                            representation_tag(request))
+    last_modified = as_utc(task.get('updated_at'))
+    response = await not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    return add_validators(jsonify({'task': make_public_task(task)}),
+                          etag, last_modified)
+
+
+@app.route('/todo/api/v1.0/tasks', methods=['POST'])
+@login_required
+async def create_task():
+    data = await request.get_json(silent=True)
+    if not data or 'title' not in data:
+        abort(400)
+    task = {
+        'title': data['title'],
+        'description': data.get('description', ""),
+        'done': False
+    }
+    task = await db.insert_new_task(task)
+    return jsonify({'task': make_public_task(task)}), 201
+
+
+@app.route('/todo/api/v1.0/tasks:batch', methods=['POST'])
+@login_required
+async def batch_tasks():
+    operations, ordered = parse_batch(await request.get_json(silent=True))
+    results = await db.apply_task_operations(operations, ordered)
+    for result in results:
+        if 'task' in result:
+            result['task'] = make_public_task(result['task'])
+    return jsonify({'results': results})
+
+
+@app.route('/todo/api/v1.0/tasks/<int:task_id>', methods=['PUT'])
+@login_required
+async def update_task(task_id):
+    data = await request.get_json(silent=True)
+    if not data or not valid_task_update(data):
+        abort(400)
+    changes = dict((field, data[field])
+                   for field in TASK_FIELDS if field in data)
+    try:
+        task = await db.update_task_fields(task_id, changes, data.get('version'))
+    except VersionConflictError:
+        abort(409)
+    if task is None:
+        abort(404)
+    return jsonify({'task': make_public_task(task)})
+
+
+@app.route('/todo/api/v1.0/tasks/<int:task_id>', methods=['DELETE'])
+@login_required
+async def delete_task(task_id):
+    if not await db.remove_task_by_id(task_id):
+        abort(404)
+    return jsonify({'result': True})
+
+
+@app.route('/healthz', methods=['GET'])
+async def health():
+    # the process is up and serving; says nothing about the database
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz', methods=['GET'])
+async def ready():
+    if not await db.ping():
+        return await make_response(jsonify({'status': 'unavailable'}), 503)
+    return jsonify({'status': 'ready'})
@@ -0,0 +1,365 @@
+import asyncio
+import logging
+import os
+
+import bcrypt
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, TEXT, ReturnDocument
+from pymongo import errors
+
+import storage
+from connection import client_settings
+from database import DatabaseHelper, _applied_deltas, _done_change, \
+    _done_count, _lost_write_count, _mark_lost_writes, _post_image, \
+    _rank_in_process, _report_write_errors, _search_page, _search_pipeline, \
+    _task_update
+from storage import _check_version, _counts_are_fresh, _now, _task_stats, \
+    TASK_LISTENER_MAX_RETRY_DELAY, TASK_LISTENER_RETRY_DELAY
+
+_client = None
+_client_loop = None
+
+
+def get_async_client():
+    # a motor client belongs to the event loop it was first used on
+    global _client, _client_loop
+    loop = asyncio.get_event_loop()
+    if _client is None or _client_loop is not loop:
+        uri, options = client_settings()
+        _client = AsyncIOMotorClient(uri, io_loop=loop, **options)
+        _client_loop = loop
+    return _client
+
+
+# same methods as DatabaseHelper, as coroutines on top of Motor
+class AsyncDatabaseHelper(DatabaseHelper):
+    def __init__(self, database_name='production', **kwargs):
+        self._id_async_lock = asyncio.Lock()
+        super(AsyncDatabaseHelper, self).__init__(database_name, **kwargs)
+
+    @property
+    def client(self):
+        return get_async_client()
+
+    def _create_indexes(self):
+        # indexes are created by create_indexes() once the event loop runs
+        pass
+
+    async def ping(self):
+        try:
+            await self.client.admin.command('ping')
+        except errors.PyMongoError as err:
+            print(err)
+            return False
+        return True
+
+    async def create_indexes(self):
+        await self.tasks.create_index('id', unique=True)
+        await self.tasks.create_index([('done', ASCENDING), ('id', ASCENDING)])
+        await self.tasks.create_index('done', name='done_true',
+                                      partialFilterExpression={'done': True})
+        await self.tasks.create_index('title')
+        await self.tasks.create_index([('title', TEXT), ('description', TEXT)],
+                                      name='task_text')
+        await self.users.create_index('username', unique=True)
+
+    async def _kdf(self, function, *args):
+        # the bounded KDF pool keeps bcrypt off the event loop
+        return await asyncio.wrap_future(self.kdf.submit(function, *args))
+
+    async def retrieve_tasks(self, done=None, fields=None, after=None,
+                             limit=None, batch_size=None, q=None):
+        if q is not None:
+            load = lambda: self.search_tasks(q, done, fields, after, limit)
+        else:
+            load = lambda: self._find_tasks(done, fields, after, limit).to_list(None)
+        if self.task_cache is not None and limit is not None and batch_size is None:
+            key = ('tasks', done, tuple(sorted(fields)) if fields else None,
+                   after, limit, q)
+            return await self._read_through(key, load)
+        if q is not None:
+            return await load()
+        tasks = self._find_tasks(done, fields, after, limit)
+        if batch_size is not None:
+            tasks = tasks.batch_size(batch_size)
+        return tasks
+
+    async def search_tasks(self, q, done=None, fields=None, after=None,
+                           limit=None):
+        if not self.text_search:
+            tasks = await self.tasks.find({} if done is None else {'done': done},
+                                          {'_id': 0}).to_list(None)
+            return _rank_in_process(tasks, q, fields, after, limit)
+        pipeline = _search_pipeline(q, done)
+        position = None
+        if after is not None:
+            found = await self.tasks.aggregate(
+                pipeline + [{'$match': {'id': after}}]).to_list(1)
+            if not found:
+                return []
+            position = found[0]
+        return await self.tasks.aggregate(
+            _search_page(pipeline, after, position, fields, limit)).to_list(None)
+
+    async def retrieve_task_with_title(self, title):
+        return await self.tasks.find_one({'title': title}, {'_id': 0})
+
+    async def retrieve_task_with_id(self, id_):
+        if self.task_cache is None:
+            return await self._find_task(id_)
+        task = await self._read_through(('task', id_), lambda: self._find_task(id_))
+        return None if task is None else dict(task)
+
+    async def _find_task(self, id_):
+        return await self.tasks.find_one({'id': id_}, {'_id': 0})
+
+    async def _read_through(self, key, load):
+        value = self.task_cache.get(key, storage._MISSING)
+        if value is storage._MISSING:
+            generation = self._task_cache_generation
+            value = await load()
+            if generation == self._task_cache_generation:
+                self.task_cache.set(key, value)
+        return value
+
+    def listen_for_task_changes(self, logger=None):
+        # cancel the returned task to stop listening
+        logger = logger or logging.getLogger(__name__)
+
+        async def listen():
+            resume_token = None
+            delay = TASK_LISTENER_RETRY_DELAY
+            while True:
+                try:
+                    async with self.tasks.watch(full_document='updateLookup',
+                                                resume_after=resume_token) as stream:
+                        async for change in stream:
+                            resume_token = stream.resume_token
+                            delay = TASK_LISTENER_RETRY_DELAY
+                            task = change.get('fullDocument')
+                            self.invalidate_task_cache(
+                                None if task is None else [task['id']])
+                    resume_token = None
+                except errors.PyMongoError as err:
+                    logger.warning('task change stream failed, reopening in '
+                                   '%ds: %s', delay, err)
+                    if isinstance(err, errors.OperationFailure):
+                        resume_token = None
+                self.invalidate_task_cache()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, TASK_LISTENER_MAX_RETRY_DELAY)
+
+        return asyncio.ensure_future(listen())
+
+    async def find_and_update_task(self, task):
+        changes = dict((key, value) for key, value in task.items() if key != 'id')
+        updated_task = await self.update_task_fields(task['id'], changes)
+        if updated_task is None:
+            raise ValueError("Task was not updated")
+        return updated_task
+
+    async def update_task_fields(self, id_, changes, version=None):
+        if changes:
+            query, update = _task_update(id_, changes, version)
+            task = await self.tasks.find_one_and_update(
+                query, update, projection={'_id': 0},
+                return_document=ReturnDocument.BEFORE)
+            if task is not None:
+                await self._record_task_change([id_], done=_done_change(task, changes))
+                return _post_image(task, update)
+        return _check_version(await self._find_task(id_), version)
+
+    async def remove_task(self, task):
+        id_ = task['id']
+        task_to_remove = await self._find_task(id_)
+        if task_to_remove == task:
+            await self.tasks.delete_one({'id': id_})
+            await self._record_task_change([id_], -1, -_done_count(task_to_remove))
+        else:
+            raise ValueError("Task was not found!")
+
+    async def remove_task_by_id(self, id_):
+        task = await self.tasks.find_one_and_delete(
+            {'id': id_}, projection={'_id': 0, 'done': 1})
+        if task is None:
+            return False
+        await self._record_task_change([id_], -1, -_done_count(task))
+        return True
+
+    async def add_task_to_db(self, task):
+        await self.tasks.insert_one(task)
+        await self._record_task_change([task.get('id')], 1, _done_count(task))
+
+    async def retrieve_task_changes(self):
+        changes = await self.counters.find_one({'_id': 'task_changes'})
+        seq, updated_at = (0, None) if changes is None else \
+            (changes['seq'], changes['updated_at'])
+        if seq != self._seen_task_changes:
+            self.invalidate_task_cache()
+            self._seen_task_changes = seq
+        return seq, updated_at
+
+    async def retrieve_task_stats(self):
+        changes = await self.counters.find_one({'_id': 'task_changes'})
+        if _counts_are_fresh(changes):
+            return _task_stats(changes['total'], changes['done'])
+        return await self.rebuild_task_stats()
+
+    async def rebuild_task_stats(self):
+        changes = await self.counters.find_one({'_id': 'task_changes'})
+        seq = 0 if changes is None else changes['seq']
+        total, done = await self.count_tasks()
+        try:
+            await self.counters.update_one(
+                {'_id': 'task_changes', 'seq': seq},
+                {'$set': {'total': total, 'done': done, 'counted': True,
+                          'counted_at': _now()},
+                 '$setOnInsert': {'updated_at': None}}, upsert=True)
+        except errors.DuplicateKeyError:
+            pass
+        return _task_stats(total, done)
+
+    async def count_tasks(self):
+        counts = await self.tasks.aggregate([{'$match': {'done': True}},
+                                             {'$count': 'done'}]).to_list(None)
+        total = await self.tasks.count_documents({})
+        return total, counts[0]['done'] if counts else 0
+
+    async def _record_task_change(self, ids=None, total=0, done=0):
+        self.invalidate_task_cache(ids)
+        changes = await self.counters.find_one_and_update(
+            {'_id': 'task_changes'},
+            {'$inc': {'seq': 1, 'total': total, 'done': done},
+             '$set': {'updated_at': _now()}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        if changes['seq'] == (self._seen_task_changes or 0) + 1:
+            self._seen_task_changes = changes['seq']
+
+    async def insert_new_task(self, task):
+        task.setdefault('version', 0)
+        task['updated_at'] = _now()
+        while True:
+            task['id'] = await self.next_task_id()
+            try:
+                await self.add_task_to_db(task)
+                task.pop('_id', None)
+                return task
+            except errors.DuplicateKeyError:
+                task.pop('_id', None)
+                await self._sync_task_id_counter()
+
+    async def next_task_id(self):
+        async with self._id_async_lock:
+            if self._id_pid != os.getpid() or self._next_id > self._last_id:
+                self._id_pid = os.getpid()
+                self._next_id = await self.reserve_task_ids(self.id_block_size)
+                self._last_id = self._next_id + self.id_block_size - 1
+            id_ = self._next_id
+            self._next_id += 1
+            return id_
+
+    async def reserve_task_ids(self, count):
+        counter = await self.counters.find_one_and_update(
+            {'_id': 'tasks'}, {'$inc': {'seq': count}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        return counter['seq'] - count + 1
+
+    async def _reserve_unused_task_ids(self, count):
+        while True:
+            first_id = await self.reserve_task_ids(count)
+            if await self.tasks.find_one({'id': {'$gte': first_id}},
+                                         {'_id': 0, 'id': 1}) is None:
+                return first_id
+            await self._sync_task_id_counter()
+
+    async def apply_task_operations(self, operations, ordered=True):
+        ids = [op['id'] for op in operations if op['op'] != 'create']
+        known = dict((task['id'], task) async for task in
+                     self.tasks.find({'id': {'$in': ids}}, {'_id': 0}))
+        creates = sum(1 for op in operations if op['op'] == 'create')
+        next_id = await self._reserve_unused_task_ids(creates) if creates else None
+        results, requests, request_items, deltas = self._plan_task_operations(
+            operations, ordered, known, next_id)
+        if requests:
+            try:
+                result = await self.tasks.bulk_write(requests, ordered=ordered)
+                counts = result.bulk_api_result
+            except errors.BulkWriteError as err:
+                _report_write_errors(err, ordered, results, request_items)
+                counts = err.details
+            lost = _lost_write_count(counts, results, request_items)
+            if lost:
+                await self._report_lost_writes(operations, results, request_items)
+            await self._record_task_change(
+                None, *_applied_deltas(results, request_items, deltas))
+            if lost:
+                await self._recount_task_stats()
+        return results
+
+    async def _report_lost_writes(self, operations, results, request_items):
+        ids = [operations[item]['id'] for item in request_items
+               if operations[item]['op'] != 'create']
+        current = dict((task['id'], task) async for task in self.tasks.find(
+            {'id': {'$in': ids}}, {'_id': 0}))
+        _mark_lost_writes(operations, results, request_items, current)
+
+    async def _recount_task_stats(self):
+        await self.counters.update_one({'_id': 'task_changes'},
+                                       {'$unset': {'counted': ''}})
+
+    async def _sync_task_id_counter(self):
+        highest = await self.tasks.find_one({}, {'_id': 0, 'id': 1},
+                                            sort=[('id', DESCENDING)])
+        if highest is not None:
+            await self.counters.update_one({'_id': 'tasks'},
+                                           {'$max': {'seq': highest['id']}},
+                                           upsert=True)
+        self._reset_task_id_block()
+
+    async def insert_user_to_db(self, user_info):
+        await self.users.insert_one(user_info)
+
+    async def retrieve_user_by_username(self, username):
+        return await self.users.find_one({'username': username}, {'_id': 0})
+
+    async def retrieve_password_hash_for_user(self, username):
+        user = await self.users.find_one({'username': username},
+                                         {'_id': 0, 'hash': 1})
+        return user['hash'] if user else None
+
+    async def create_non_existing_user_to_database(self, username, password):
+        hash_ = await self._kdf(bcrypt.hashpw, password.encode('utf-8'),
+                                bcrypt.gensalt(self.encryption_rounds))
+        user_info = {'username': username, 'hash': hash_}
+        user = await self.retrieve_user_by_username(username)
+        if not user:
+            await self.insert_user_to_db(user_info)
+            self.invalidate_credentials(username)
+
+    async def check_password_hash_for_user(self, username, password):
+        hash_ = await self.retrieve_password_hash_for_user(username)
+        if hash_ is None:
+            return False
+        key = (username, self._credential_digest(hash_, password))
+        if self.verified_credentials.get(key):
+            return True
+        verified = await self._kdf(bcrypt.checkpw, password.encode('utf-8'), hash_)
+        if verified:
+            self.verified_credentials.set(key, True)
+        return verified
+
+
+class AsyncTestDB(AsyncDatabaseHelper):
+    text_search = False
+    encryption_rounds = 4
+
+    def __init__(self, task_cache=False):
+        super(AsyncTestDB, self).__init__('test', task_cache=task_cache)
+
+    async def create_test_users_to_test_db(self):
+        await self.create_non_existing_user_to_database('mojo', 'python')
+        await self.create_non_existing_user_to_database('kojo', 'python')
+
+    async def remove_test_users_from_db(self):
+        await self.users.delete_many({})
+        self.verified_credentials.clear()
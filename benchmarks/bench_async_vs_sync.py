@@ -0,0 +1,78 @@
+# run instructions: start a local mongod, then serve both apps, e.g.
+# python app.py                                    (sync, port 5000)
+# hypercorn --bind 127.0.0.1:8000 async_app:app    (async, port 8000)
+# cd /restful_api_with_mongo_db
+# python benchmarks/bench_async_vs_sync.py http://127.0.0.1:5000 http://127.0.0.1:8000
+
+import base64
+import http.client
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+CONCURRENCY = [1, 16, 64, 256]
+DURATION = 10  # seconds
+PATH = '/todo/api/v1.0/tasks/1'
+CREDENTIALS = b'mojo:python'
+
+
+def percentile(latencies, fraction):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+def drive(base_url, clients, duration):
+    url = urlsplit(base_url)
+    headers = {'Authorization': 'Basic ' + base64.b64encode(CREDENTIALS).decode('utf-8')}
+    deadline = time.time() + duration
+    latencies, failures = [], [0]
+    lock = threading.Lock()
+
+    def client():
+        connection = http.client.HTTPConnection(url.hostname, url.port)
+        own = []
+        while time.time() < deadline:
+            start = time.time()
+            try:
+                connection.request('GET', PATH, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(url.hostname, url.port)
+                ok = False
+            if ok:
+                own.append(time.time() - start)
+            else:
+                with lock:
+                    failures[0] += 1
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures[0]
+
+
+def main(urls):
+    print('%-32s %8s %10s %10s %10s %8s' % ('server', 'clients', 'req/s',
+                                           'p50 ms', 'p99 ms', 'errors'))
+    for base_url in urls:
+        for clients in CONCURRENCY:
+            latencies, failures = drive(base_url, clients, DURATION)
+            if not latencies:
+                print('%-32s %8d %10s' % (base_url, clients, 'no responses'))
+                continue
+            print('%-32s %8d %10.0f %10.2f %10.2f %8d' % (
+                base_url, clients, len(latencies) / float(DURATION),
+                percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000, failures))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or ['http://127.0.0.1:5000', 'http://127.0.0.1:8000'])
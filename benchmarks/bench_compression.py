@@ -0,0 +1,87 @@
+# run instructions: pip install mongomock brotli (both optional)
+# cd /restful_api_with_mongo_db
+# python benchmarks/bench_compression.py
+#
+# Bytes on the wire and CPU time of GET /tasks for each encoding, for the
+# buffered JSON listing and the ndjson stream. Tasks are served from the
+# in-memory backend so the numbers are about encoding, not the database.
+
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import connection
+from memory_database import MemoryDatabaseHelper
+
+try:
+    # nothing here touches Mongo, a stand-in saves waiting for mongod
+    import mongomock
+    connection.configure(client_class=mongomock.MongoClient)
+except ImportError:
+    pass
+
+import app as app_module
+from compression import brotli
+
+SIZES = [1000, 100000]
+REPEAT = 3
+CREDENTIALS = b'bench:python'
+
+
+def encodings():
+    yield 'identity', 'identity', None
+    for level in (1, 6, 9):
+        yield 'gzip-%d' % level, 'gzip', level
+    if brotli is not None:
+        for quality in (1, 4, 11):
+            yield 'br-%d' % quality, 'br', quality
+
+
+def measure(client, path, headers):
+    wire = cpu = None
+    for _ in range(REPEAT):
+        started = time.process_time()
+        response = client.get(path, headers=headers)
+        data = response.get_data()
+        elapsed = time.process_time() - started
+        assert response.status_code == 200, response.status_code
+        wire = len(data)
+        cpu = elapsed if cpu is None else min(cpu, elapsed)
+    return wire, cpu
+
+
+def main():
+    app_module.create_app({'RATE_LIMIT_ENABLED': False})
+    compressor = app_module.compressor
+    authorization = 'Basic ' + base64.b64encode(CREDENTIALS).decode('utf-8')
+    print('%-8s %-8s %-10s %12s %8s %10s' % ('tasks', 'listing', 'encoding',
+                                             'bytes', 'ratio', 'cpu ms'))
+    for size in SIZES:
+        db = app_module.db = MemoryDatabaseHelper('benchmark', task_cache=False)
+        db.create_non_existing_user_to_database('bench', 'python')
+        for id_ in range(1, size + 1):
+            db.add_task_to_db({'id': id_, 'title': u'Task %d' % id_,
+                               'description': u'Something to do before %d' % id_,
+                               'done': id_ % 3 == 0})
+        client = app_module.app.test_client()
+        for listing, path in (('json', '/todo/api/v1.0/tasks'),
+                              ('ndjson', '/todo/api/v1.0/tasks?stream=1')):
+            identity_bytes = None
+            for name, encoding, level in encodings():
+                if encoding == 'gzip':
+                    compressor.level = level
+                elif encoding == 'br':
+                    compressor.brotli_quality = level
+                wire, cpu = measure(client, path, {'Authorization': authorization,
+                                                   'Accept-Encoding': encoding})
+                identity_bytes = identity_bytes or wire
+                print('%-8d %-8s %-10s %12d %8.3f %10.1f' % (
+                    size, listing, name, wire, float(wire) / identity_bytes,
+                    cpu * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# run instructions: start a local mongod
+# cd /restful_api_with_mongo_db
+# python benchmarks/bench_id_allocation.py
+
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import DatabaseHelper
+
+WORKERS = 8
+INSERTS_PER_WORKER = 2000
+BLOCK_SIZES = [1, 10, 100]
+
+
+class BenchmarkDB(DatabaseHelper):
+    def __init__(self, id_block_size=1):
+        super(BenchmarkDB, self).__init__('benchmark', id_block_size)
+
+
+def insert_tasks(block_size):
+    # each worker opens its own client after the fork
+    db = BenchmarkDB(block_size)
+    ids = []
+    for i in range(INSERTS_PER_WORKER):
+        task = db.insert_new_task({'title': u'Task %d' % i,
+                                   'description': u'',
+                                   'done': False})
+        ids.append(task['id'])
+    return ids
+
+
+def main():
+    db = BenchmarkDB()
+    print('%10s %14s %10s' % ('block', 'inserts/s', 'unique'))
+    for block_size in BLOCK_SIZES:
+        db.tasks.delete_many({})
+        db.counters.delete_many({})
+        pool = multiprocessing.Pool(WORKERS)
+        start = time.time()
+        results = pool.map(insert_tasks, [block_size] * WORKERS)
+        elapsed = time.time() - start
+        pool.close()
+        pool.join()
+        ids = [id_ for worker_ids in results for id_ in worker_ids]
+        unique = len(set(ids)) == len(ids) == db.tasks.count_documents({})
+        print('%10d %14.0f %10s' % (block_size, len(ids) / elapsed, unique))
+        if not unique:
+            sys.exit('duplicate task ids were allocated')
+
+    db.client.drop_database('benchmark')
+
+
+if __name__ == '__main__':
+    main()
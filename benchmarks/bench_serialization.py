@@ -0,0 +1,68 @@
+# run instructions: pip install orjson mongomock (both optional)
+# cd /restful_api_with_mongo_db
+# python benchmarks/bench_serialization.py
+
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import url_for
+from flask.json.provider import DefaultJSONProvider
+
+import connection
+import serialization
+
+try:
+    # nothing here touches the database, a stand-in saves waiting for mongod
+    import mongomock
+    connection.configure(client_class=mongomock.MongoClient)
+except ImportError:
+    pass
+
+import app as app_module
+
+TASKS = 10000
+REPEAT = 5
+
+
+def legacy_make_public_task(task):
+    new_task = {}
+    for field in task:
+        if field == 'id':
+            new_task['uri'] = url_for('get_task', task_id=task['id'], _external=True)
+        elif field != 'updated_at':
+            new_task[field] = task[field]
+    return new_task
+
+
+def main():
+    app = app_module.app
+    now = datetime.now(timezone.utc)
+    tasks = [{'id': id_, 'title': u'Task %d' % id_,
+              'description': u'Something to do', 'done': id_ % 2 == 0,
+              'version': 0, 'updated_at': now} for id_ in range(1, TASKS + 1)]
+    stdlib = DefaultJSONProvider(app)
+
+    def legacy():
+        body = {'tasks': [legacy_make_public_task(task) for task in tasks]}
+        return stdlib.response(body).get_data()
+
+    def optimized():
+        body = {'tasks': serialization.public_tasks(tasks, app_module.task_uri_prefix())}
+        return app.json.response(body).get_data()
+
+    with app.test_request_context('/todo/api/v1.0/tasks'):
+        assert json.loads(legacy()) == json.loads(optimized())
+        print('%d tasks, encoder %s' % (TASKS, serialization.JSON_ENCODER))
+        print('%-12s %12s' % ('path', 'ms/response'))
+        for name, function in (('legacy', legacy), ('optimized', optimized)):
+            seconds = min(timeit.repeat(function, number=1, repeat=REPEAT))
+            print('%-12s %12.2f' % (name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+# run instructions: pip install mongomock (or start a local mongod)
+# cd /restful_api_with_mongo_db
+# python benchmarks/bench_suite.py --backend mongomock
+# python benchmarks/bench_suite.py --backend mongod --update-baseline
+#
+# Every route is driven through app.test_client() and through a WSGI server
+# on 127.0.0.1. Results are compared with benchmarks/baselines/<backend>.json
+# and the script exits with status 1 on a regression. Latencies are compared
+# as multiples of a calibration workload timed in the same run, so a baseline
+# recorded on one machine still holds on a slower or faster one.
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import connection
+import storage
+from database import DatabaseHelper
+
+SIZES = {'mongomock': [1000, 5000], 'mongod': [1000, 10000, 100000]}
+BATCH_SIZE = 10000
+REQUESTS = 200
+COLD_AUTH_REQUESTS = 10
+TOLERANCE = 1.5  # allowed p50 slowdown against the baseline
+CALIBRATION_RUNS = 50
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+API = '/todo/api/v1.0'
+CREDENTIALS = b'bench:python'
+
+
+class BenchmarkDB(DatabaseHelper):
+    def __init__(self):
+        super(BenchmarkDB, self).__init__('benchmark')
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class TestClientTransport(object):
+    name = 'test_client'
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body, headers):
+        response = self.client.open(path, method=method, data=body, headers=headers)
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class ServerTransport(object):
+    name = 'wsgi_server'
+
+    def __init__(self, app):
+        self.server = make_server('127.0.0.1', 0, app,
+                                  server_class=ThreadingWSGIServer,
+                                  handler_class=QuietHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def request(self, method, path, body, headers):
+        # wsgiref speaks HTTP/1.0, so every request opens a new connection
+        connection_ = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+        try:
+            connection_.request(method, path, body=body, headers=headers)
+            response = connection_.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection_.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def seed(db, size):
+    db.client.drop_database('benchmark')
+    db._create_indexes()
+    for start in range(1, size + 1, BATCH_SIZE):
+        stop = min(start + BATCH_SIZE, size + 1)
+        db.tasks.insert_many([{'id': id_,
+                               'title': u'Task %d' % id_,
+                               'description': u'',
+                               'done': id_ % 2 == 0,
+                               'version': 0,
+                               'updated_at': storage._now()}
+                              for id_ in range(start, stop)])
+    db._sync_task_id_counter()
+    db.invalidate_task_cache()
+    db.create_non_existing_user_to_database('bench', 'python')
+
+
+def scenarios(db, size, token):
+    basic = {'Authorization': 'Basic ' + base64.b64encode(CREDENTIALS).decode('utf-8')}
+    bearer = {'Authorization': 'Bearer ' + token}
+    json_ = dict(bearer, **{'Content-Type': 'application/json'})
+
+    def spread(i):
+        # visit ids all over the collection so the task cache mostly misses
+        return 1 + (i * 7919) % size
+
+    def forget_credentials(i):
+        db.verified_credentials.clear()
+
+    # name, requests, expected status, request(i), before(i)
+    return [
+        ('get_task', REQUESTS, 200,
+         lambda i: ('GET', '%s/tasks/%d' % (API, spread(i)), None, bearer), None),
+        ('list_tasks', REQUESTS, 200,
+         lambda i: ('GET', '%s/tasks?limit=100&after=%d' % (API, spread(i) - 1),
+                    None, bearer), None),
+        ('list_undone_tasks', REQUESTS, 200,
+         lambda i: ('GET', '%s/tasks?done=false&limit=100&after=%d'
+                    % (API, spread(i) - 1), None, bearer), None),
+        ('task_stats', REQUESTS, 200,
+         lambda i: ('GET', '%s/tasks/stats' % API, None, bearer), None),
+        ('create_token', REQUESTS, 201,
+         lambda i: ('POST', '%s/tokens' % API, None, basic), None),
+        ('basic_auth_cold', COLD_AUTH_REQUESTS, 200,
+         lambda i: ('GET', '%s/tasks/%d' % (API, spread(i)), None, basic),
+         forget_credentials),
+        ('create_task', REQUESTS, 201,
+         lambda i: ('POST', '%s/tasks' % API,
+                    json.dumps({'title': u'New task %d' % i}), json_), None),
+        ('update_task', REQUESTS, 200,
+         lambda i: ('PUT', '%s/tasks/%d' % (API, spread(i)),
+                    json.dumps({'done': True}), json_), None),
+        ('delete_task', REQUESTS, 200,
+         lambda i: ('DELETE', '%s/tasks/%d' % (API, size - i), None, bearer), None),
+    ]
+
+
+def percentile(latencies, fraction):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+def calibrate():
+    # pure Python work of the kind the routes do: build task dicts, encode
+    # and decode them, sort and filter
+    latencies = []
+    for _ in range(CALIBRATION_RUNS):
+        start = time.perf_counter()
+        tasks = [{'id': id_, 'title': u'Task %d' % id_, 'done': id_ % 2 == 0}
+                 for id_ in range(2000)]
+        tasks = json.loads(json.dumps(tasks))
+        sorted((task for task in tasks if not task['done']),
+               key=lambda task: task['title'])
+        latencies.append(time.perf_counter() - start)
+    return percentile(latencies, 0.5) * 1000
+
+
+def run_scenario(transport, requests, expected, make_request, before):
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for i in range(requests):
+        if before is not None:
+            before(i)
+        method, path, body, headers = make_request(i)
+        start = time.perf_counter()
+        status = transport.request(method, path, body, headers)
+        latencies.append(time.perf_counter() - start)
+        if status != expected:
+            errors += 1
+    elapsed = time.perf_counter() - started
+    return {'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'rps': round(requests / elapsed, 1),
+            'errors': errors}
+
+
+def index_problems(db, size):
+    # a full collection scan on the hot queries is a regression regardless
+    # of timing, but only a real mongod can explain its plans
+    queries = {'get_task': db.tasks.find({'id': size // 2}, {'_id': 0}),
+               'list_tasks': db._find_tasks(None, None, size // 2, 100),
+               'list_undone_tasks': db._find_tasks(False, None, size // 2, 100)}
+    problems = []
+    for name, cursor in sorted(queries.items()):
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        if 'COLLSCAN' in json.dumps(plan):
+            problems.append('%s scans the whole tasks collection' % name)
+    return problems
+
+
+def compare(results, baseline, tolerance):
+    problems = []
+    if baseline.get('encryption_rounds') != results['encryption_rounds']:
+        problems.append('bcrypt cost changed from %s to %s rounds' % (
+            baseline.get('encryption_rounds'), results['encryption_rounds']))
+    for key, result in sorted(results['results'].items()):
+        if result['errors']:
+            problems.append('%s: %d unexpected responses' % (key, result['errors']))
+        expected = baseline.get('results', {}).get(key, {}).get('p50_relative')
+        if expected is not None and result['p50_relative'] > expected * tolerance:
+            problems.append('%s: p50 %.2fx the calibration run, baseline %.2fx' % (
+                key, result['p50_relative'], expected))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=['mongomock', 'mongod'], default='mongomock')
+    parser.add_argument('--uri', default=None, help='mongod uri, defaults to localhost')
+    parser.add_argument('--sizes', default=None, help='comma separated task counts')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    if args.backend == 'mongomock':
+        import mongomock
+        connection.configure(client_class=mongomock.MongoClient)
+    else:
+        connection.configure(args.uri)
+    import app as app_module
+    # measure the routes, not the rate limiter
+    app_module.create_app({'RATE_LIMIT_ENABLED': False})
+    # a DatabaseHelper hashes at the production bcrypt cost, unlike TestDB
+    db = BenchmarkDB()
+    app_module.db = db
+    token = app_module.tokens.sign('bench')
+
+    calibration_ms = calibrate()
+    results = {'backend': args.backend,
+               'encryption_rounds': db.encryption_rounds,
+               'calibration_ms': round(calibration_ms, 3),
+               'results': {}}
+    print('calibration run p50 %.3f ms' % calibration_ms)
+    problems = []
+    print('%-12s %-18s %8s %10s %10s %10s %7s' % (
+        'transport', 'route', 'tasks', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+    sizes = [int(size) for size in args.sizes.split(',')] if args.sizes \
+        else SIZES[args.backend]
+    for size in sizes:
+        for transport_class in (TestClientTransport, ServerTransport):
+            seed(db, size)
+            if args.backend == 'mongod':
+                problems.extend(index_problems(db, size))
+            transport = transport_class(app_module.app)
+            try:
+                for name, requests, expected, make_request, before in \
+                        scenarios(db, size, token):
+                    result = run_scenario(transport, requests, expected,
+                                          make_request, before)
+                    result['p50_relative'] = round(result['p50_ms'] / calibration_ms, 3)
+                    results['results']['%s %s %d' % (transport.name, name, size)] = result
+                    print('%-12s %-18s %8d %10.1f %10.3f %10.3f %7d' % (
+                        transport.name, name, size, result['rps'],
+                        result['p50_ms'], result['p99_ms'], result['errors']))
+            finally:
+                transport.close()
+    db.client.drop_database('benchmark')
+
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, '%s.json' % args.backend)
+    if args.update_baseline:
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print('baseline written to %s' % baseline_path)
+    elif os.path.exists(baseline_path):
+        with open(baseline_path) as baseline_file:
+            problems.extend(compare(results, json.load(baseline_file), args.tolerance))
+    else:
+        print('no baseline at %s, run with --update-baseline to create one'
+              % baseline_path)
+
+    for problem in problems:
+        print('REGRESSION: %s' % problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# run instructions: start a local mongod
+# cd /restful_api_with_mongo_db
+# python benchmarks/bench_task_lookup.py
+
+import base64
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as app_module
+from database import DatabaseHelper
+
+SIZES = [1000, 10000, 100000, 1000000]
+BATCH_SIZE = 10000
+REQUESTS = 200
+
+
+class BenchmarkDB(DatabaseHelper):
+    def __init__(self):
+        super(BenchmarkDB, self).__init__('benchmark')
+
+
+def seed_tasks(db, size):
+    db.tasks.delete_many({})
+    for start in range(1, size + 1, BATCH_SIZE):
+        stop = min(start + BATCH_SIZE, size + 1)
+        db.tasks.insert_many([{'id': id_,
+                               'title': u'Task %d' % id_,
+                               'description': u'',
+                               'done': False} for id_ in range(start, stop)])
+
+
+def main():
+    db = BenchmarkDB()
+    db.create_non_existing_user_to_database('bench', 'python')
+    app_module.create_app({'RATE_LIMIT_ENABLED': False})
+    app_module.db = db
+    client = app_module.app.test_client()
+    credentials = base64.b64encode(b'bench:python').decode('utf-8')
+    headers = {'Authorization': 'Basic ' + credentials}
+
+    print('%10s %14s' % ('tasks', 'ms/request'))
+    for size in SIZES:
+        seed_tasks(db, size)
+        task_ids = [size // 2, size, 1]
+
+        def get_tasks():
+            for task_id in task_ids:
+                client.get('/todo/api/v1.0/tasks/%d' % task_id, headers=headers)
+
+        seconds = timeit.timeit(get_tasks, number=REQUESTS)
+        print('%10d %14.3f' % (size, seconds * 1000 / (REQUESTS * len(task_ids))))
+
+    db.client.drop_database('benchmark')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# run instructions: start a local mongod
+# cd /restful_api_with_mongo_db
+# python benchmarks/bench_user_lookup.py
+
+import os
+import sys
+import timeit
+
+import bcrypt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import DatabaseHelper
+
+SIZES = [1000, 10000, 100000]
+BATCH_SIZE = 10000
+LOOKUPS = 1000
+
+
+class BenchmarkDB(DatabaseHelper):
+    def __init__(self):
+        super(BenchmarkDB, self).__init__('benchmark')
+
+
+def seed_users(db, size):
+    # every user shares one hash so seeding is not dominated by bcrypt
+    hash_ = bcrypt.hashpw(b'python', bcrypt.gensalt(4))
+    db.users.delete_many({})
+    for start in range(0, size, BATCH_SIZE):
+        stop = min(start + BATCH_SIZE, size)
+        db.users.insert_many([{'username': 'user%d' % i, 'hash': hash_}
+                              for i in range(start, stop)])
+
+
+def main():
+    db = BenchmarkDB()
+
+    print('%10s %16s %16s' % ('users', 'lookup ms', 'check ms'))
+    for size in SIZES:
+        seed_users(db, size)
+        username = 'user%d' % (size - 1)
+
+        lookup = timeit.timeit(
+            lambda: db.retrieve_password_hash_for_user(username), number=LOOKUPS)
+
+        def check():
+            db.verified_credentials.clear()
+            db.check_password_hash_for_user(username, 'python')
+
+        check_seconds = timeit.timeit(check, number=LOOKUPS // 10)
+        print('%10d %16.3f %16.3f' % (size, lookup * 1000 / LOOKUPS,
+                                      check_seconds * 1000 / (LOOKUPS // 10)))
+
+    db.client.drop_database('benchmark')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# run instructions: pip install mongomock (optional, or start a local mongod)
+# cd /restful_api_with_mongo_db
+# python benchmarks/bench_workers.py --workers 4
+#
+# Forks workers the way gunicorn and uwsgi do, once with wsgi.py imported in
+# the master (preload) and once with every worker importing it itself, and
+# reports how long each worker takes to answer /readyz and how much memory
+# it holds. PSS splits shared pages between the processes sharing them, so
+# it is the number that shows what preloading saves. Linux only.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import connection
+
+
+def memory_kb(pid):
+    values = {}
+    with open('/proc/%d/smaps_rollup' % pid) as smaps:
+        for line in smaps:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                values[parts[0][:-1]] = int(parts[1])
+    return {'rss': values['Rss'], 'pss': values['Pss'],
+            'private': values['Private_Clean'] + values['Private_Dirty']}
+
+
+def worker(preload, forked_at, report, release):
+    if preload is None:
+        import wsgi
+        app = wsgi.app
+    else:
+        app = preload
+    response = app.test_client().get('/readyz')
+    ready = time.monotonic() - forked_at
+    os.write(report, (json.dumps({'pid': os.getpid(), 'ready': ready,
+                                  'status': response.status_code}) + '\n').encode())
+    # stay alive until the master has measured every worker at once
+    os.read(release, 1)
+    os._exit(0)
+
+
+def run(workers, preload):
+    app = None
+    imported = 0.0
+    if preload:
+        started = time.monotonic()
+        import wsgi
+        app = wsgi.app
+        imported = time.monotonic() - started
+    report_read, report_write = os.pipe()
+    release_read, release_write = os.pipe()
+    pids = []
+    for _ in range(workers):
+        forked_at = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            os.close(report_read)
+            os.close(release_write)
+            worker(app, forked_at, report_write, release_read)
+        pids.append(pid)
+    os.close(report_write)
+    os.close(release_read)
+    reports = []
+    with os.fdopen(report_read) as lines:
+        for _ in range(workers):
+            reports.append(json.loads(lines.readline()))
+    for report in reports:
+        report.update(memory_kb(report['pid']))
+    os.close(release_write)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    return imported, reports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--mode', choices=['preload', 'lazy'], default=None,
+                        help='one mode per process, both when not given')
+    args = parser.parse_args()
+
+    if args.mode is None:
+        # each mode needs a process that has not imported the app yet
+        for mode in ('preload', 'lazy'):
+            pid = os.fork()
+            if pid == 0:
+                sys.argv[1:] = ['--workers', str(args.workers), '--mode', mode]
+                main()
+                os._exit(0)
+            os.waitpid(pid, 0)
+        return
+
+    try:
+        import mongomock
+        connection.configure(client_class=mongomock.MongoClient)
+    except ImportError:
+        pass
+    imported, reports = run(args.workers, args.mode == 'preload')
+    print('%s: %d workers, master import %.1f ms' % (args.mode, args.workers,
+                                                     imported * 1000))
+    print('%8s %10s %8s %10s %10s %10s' % ('pid', 'ready ms', 'status', 'rss MB',
+                                           'pss MB', 'private MB'))
+    for report in reports:
+        print('%8d %10.1f %8d %10.1f %10.1f %10.1f' % (
+            report['pid'], report['ready'] * 1000, report['status'],
+            report['rss'] / 1024.0, report['pss'] / 1024.0,
+            report['private'] / 1024.0))
+    print('%8s %10.1f %8s %10s %10.1f %10.1f' % (
+        'mean', sum(r['ready'] for r in reports) * 1000 / len(reports), '', '',
+        sum(r['pss'] for r in reports) / 1024.0 / len(reports),
+        sum(r['private'] for r in reports) / 1024.0 / len(reports)))
+
+
+if __name__ == '__main__':
+    main()
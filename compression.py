@@ -0,0 +1,134 @@
+import os
+import threading
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# responses smaller than this are sent as they are, the headers and the
+# compression work would cost more than the bytes saved
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))  # gzip, 1-9
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))  # 0-11
+COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/plain',
+                      'text/html')
+# a streamed response is flushed to the client at least this often, so
+# clients see tasks arrive without a sync flush after every line
+STREAM_FLUSH_SIZE = 64 * 1024
+
+
+class GzipEncoder(object):
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder(object):
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class Compressor(object):
+    def __init__(self, min_size=COMPRESS_MIN_SIZE, level=COMPRESS_LEVEL,
+                 brotli_quality=COMPRESS_BROTLI_QUALITY,
+                 mimetypes=COMPRESS_MIMETYPES):
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.mimetypes = mimetypes
+        self.encodings = ('br', 'gzip') if brotli else ('gzip',)
+        self._lock = threading.Lock()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def init_app(self, app):
+        app.after_request(self.compress_response)
+
+    def encoder(self, encoding):
+        if encoding == 'br':
+            return BrotliEncoder(self.brotli_quality)
+        return GzipEncoder(self.level)
+
+    def compress_response(self, response):
+        if response.mimetype not in self.mimetypes:
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.status_code < 200 or response.status_code in (204, 304) or \
+                request.method == 'HEAD' or response.direct_passthrough or \
+                'Content-Encoding' in response.headers:
+            return response
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            # the length is unknown up front, so streams are always compressed
+            response.response = self._compress_chunks(response.response,
+                                                      self.encoder(encoding))
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            encoder = self.encoder(encoding)
+            compressed = encoder.compress(data) + encoder.finish()
+            response.set_data(compressed)
+            self._count(len(data), len(compressed))
+        response.headers['Content-Encoding'] = encoding
+        # the bytes differ from the identity encoding, the meaning does not
+        if response.get_etag()[0]:
+            response.set_etag(response.get_etag()[0], weak=True)
+        return response
+
+    def _compress_chunks(self, chunks, encoder):
+        size_in = size_out = pending = 0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                size_in += len(chunk)
+                pending += len(chunk)
+                data = encoder.compress(chunk)
+                if pending >= STREAM_FLUSH_SIZE:
+                    data += encoder.flush()
+                    pending = 0
+                if data:
+                    size_out += len(data)
+                    yield data
+            data = encoder.finish()
+            size_out += len(data)
+            yield data
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            self._count(size_in, size_out)
+
+    def _count(self, size_in, size_out):
+        with self._lock:
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+
+    def statistics(self):
+        with self._lock:
+            return {'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out}
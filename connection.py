@@ -0,0 +1,130 @@
+import os
+import threading
+
+from pymongo import MongoClient, monitoring
+
+from metrics import metrics
+
+# environment variable, MongoClient option, type
+CLIENT_SETTINGS = [
+    ('MONGO_MAX_POOL_SIZE', 'maxPoolSize', int),
+    ('MONGO_MIN_POOL_SIZE', 'minPoolSize', int),
+    ('MONGO_WAIT_QUEUE_TIMEOUT_MS', 'waitQueueTimeoutMS', int),
+    ('MONGO_SERVER_SELECTION_TIMEOUT_MS', 'serverSelectionTimeoutMS', int),
+    ('MONGO_READ_PREFERENCE', 'readPreference', str),
+    ('MONGO_WRITE_CONCERN', 'w', lambda value: int(value) if value.isdigit() else value),
+]
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+_uri = None
+_options = None
+_client_class = MongoClient
+
+
+class PoolStatistics(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.check_outs = 0
+            self.check_out_failures = 0
+
+    def as_dict(self):
+        with self._lock:
+            return {'connections': self.connections,
+                    'checked_out': self.checked_out,
+                    'max_checked_out': self.max_checked_out,
+                    'check_outs': self.check_outs,
+                    'check_out_failures': self.check_out_failures}
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections -= 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.check_outs += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.check_out_failures += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+pool_statistics = PoolStatistics()
+
+
+def client_options_from_env(environ=None):
+    environ = os.environ if environ is None else environ
+    options = {}
+    for variable, option, type_ in CLIENT_SETTINGS:
+        if environ.get(variable):
+            options[option] = type_(environ[variable])
+    return options
+
+
+def configure(uri=None, client_class=MongoClient, **options):
+    # client_class lets benchmarks run against a stand-in such as mongomock
+    global _client, _uri, _options, _client_class
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _uri = uri
+        _options = options
+        _client_class = client_class
+
+
+def client_settings():
+    if _options is None:
+        return os.environ.get('MONGO_URI'), client_options_from_env()
+    return _uri, dict(_options)
+
+
+def get_client():
+    # one client per process: a client inherited through fork is never reused
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                uri, options = client_settings()
+                pool_statistics.reset()
+                _client = _client_class(uri, event_listeners=[pool_statistics,
+                                                              metrics.command_listener],
+                                        **options)
+                _client_pid = os.getpid()
+    return _client
@@ -1,61 +1,378 @@
-import bcrypt, sys
-from pymongo import MongoClient
+import logging
+import threading
+
+from pymongo import ASCENDING, DESCENDING, TEXT, ReturnDocument
+from pymongo import DeleteOne, InsertOne, UpdateOne
 from pymongo import errors
 
+from connection import get_client
+from search import InvertedIndex, rank
+from storage import Storage, _check_version, _counts_are_fresh, _now, \
+    _task_stats, TASK_CACHE_ENABLED, TASK_ID_BLOCK_SIZE, \
+    TASK_LISTENER_MAX_RETRY_DELAY, TASK_LISTENER_RETRY_DELAY
 
-if "app.py" == sys.argv[0]:
-    ENCRYPTION_ROUNDS = 12
-else:
-    ENCRYPTION_ROUNDS = 4  # if running unit tests
 
+class DatabaseHelper(Storage):
+    # False ranks ?q= searches in process instead of with the text index
+    text_search = True
 
-class DatabaseHelper(object):
-    def __init__(self):
+    def __init__(self, database_name='production',
+                 id_block_size=TASK_ID_BLOCK_SIZE, task_cache=TASK_CACHE_ENABLED,
+                 kdf=None):
+        self.database_name = database_name
+        self._stop_listening = threading.Event()
+        super(DatabaseHelper, self).__init__(id_block_size, task_cache, kdf)
         try:
-            self.client = MongoClient()
-            self.db = self.client.production
-            self.tasks = self.db.tasks
-            self.users = self.db.users
+            self._create_indexes()
         except errors.ServerSelectionTimeoutError as err:
             print(err)
 
-    def retrieve_tasks(self):
-        return self.tasks.find({}, {'_id': 0})
+    @property
+    def client(self):
+        return get_client()
+
+    @property
+    def db(self):
+        return self.client[self.database_name]
+
+    @property
+    def tasks(self):
+        return self.db.tasks
+
+    @property
+    def users(self):
+        return self.db.users
+
+    @property
+    def counters(self):
+        return self.db.counters
+
+    def _create_indexes(self):
+        self.tasks.create_index('id', unique=True)
+        self.tasks.create_index([('done', ASCENDING), ('id', ASCENDING)])
+        # only done tasks are indexed, which is all the statistics count
+        self.tasks.create_index('done', name='done_true',
+                                partialFilterExpression={'done': True})
+        self.tasks.create_index('title')
+        self.tasks.create_index([('title', TEXT), ('description', TEXT)],
+                                name='task_text')
+        self.users.create_index('username', unique=True)
+
+    def retrieve_tasks(self, done=None, fields=None, after=None, limit=None,
+                       batch_size=None, q=None):
+        if q is not None:
+            load = lambda: self.search_tasks(q, done, fields, after, limit)
+        else:
+            load = lambda: list(self._find_tasks(done, fields, after, limit))
+        # only bounded pages are cached, full listings and streams go to Mongo
+        if self.task_cache is not None and limit is not None and batch_size is None:
+            key = ('tasks', done, tuple(sorted(fields)) if fields else None,
+                   after, limit, q)
+            return self._read_through(key, load)
+        if q is not None:
+            return load()
+        tasks = self._find_tasks(done, fields, after, limit)
+        if batch_size is not None:
+            tasks = tasks.batch_size(batch_size)
+        return tasks
+
+    def _find_tasks(self, done, fields, after, limit):
+        query = {}
+        if done is not None:
+            query['done'] = done
+        if after is not None:
+            query['id'] = {'$gt': after}
+        projection = {'_id': 0}
+        if fields is not None:
+            projection.update((field, 1) for field in set(fields) | {'id'})
+        tasks = self.tasks.find(query, projection)
+        if after is not None or limit is not None:
+            tasks = tasks.sort('id', ASCENDING)
+        if limit is not None:
+            tasks = tasks.limit(limit)
+        return tasks
+
+    def search_tasks(self, q, done=None, fields=None, after=None, limit=None):
+        if not self.text_search:
+            tasks = self.tasks.find({} if done is None else {'done': done}, {'_id': 0})
+            return _rank_in_process(tasks, q, fields, after, limit)
+        pipeline = _search_pipeline(q, done)
+        position = None
+        if after is not None:
+            position = next(self.tasks.aggregate(
+                pipeline + [{'$match': {'id': after}}]), None)
+            if position is None:
+                # the task this page follows no longer matches
+                return []
+        return list(self.tasks.aggregate(
+            _search_page(pipeline, after, position, fields, limit)))
 
     def retrieve_task_with_title(self, title):
         return self.tasks.find_one({'title': title}, {'_id': 0})
 
     def retrieve_task_with_id(self, id_):
+        if self.task_cache is None:
+            return self._find_task(id_)
+        task = self._read_through(('task', id_), lambda: self._find_task(id_))
+        return None if task is None else dict(task)
+
+    def _find_task(self, id_):
         return self.tasks.find_one({'id': id_}, {'_id': 0})
 
-    def find_and_update_task(self, task):
-        id_ = task['id']
-        tasks = self.retrieve_tasks()
+    def listen_for_task_changes(self, logger=None):
+        # keeps the caches of several workers coherent; needs a replica set
+        logger = logger or logging.getLogger(__name__)
+
+        def listen():
+            resume_token = None
+            delay = TASK_LISTENER_RETRY_DELAY
+            while not self._stop_listening.is_set():
+                try:
+                    with self.tasks.watch(full_document='updateLookup',
+                                          resume_after=resume_token) as stream:
+                        for change in stream:
+                            resume_token = stream.resume_token
+                            delay = TASK_LISTENER_RETRY_DELAY
+                            task = change.get('fullDocument')
+                            self.invalidate_task_cache(
+                                None if task is None else [task['id']])
+                    # the stream was invalidated, there is nothing to resume
+                    resume_token = None
+                except errors.PyMongoError as err:
+                    logger.warning('task change stream failed, reopening in '
+                                   '%ds: %s', delay, err)
+                    if isinstance(err, errors.OperationFailure):
+                        # the server refused to resume, start afresh
+                        resume_token = None
+                # changes made while the stream was down were not seen
+                self.invalidate_task_cache()
+                self._stop_listening.wait(delay)
+                delay = min(delay * 2, TASK_LISTENER_MAX_RETRY_DELAY)
+
+        listener = threading.Thread(target=listen, name='task-change-listener')
+        listener.daemon = True
+        listener.start()
+        return listener
+
+    def stop_listening(self):
+        self._stop_listening.set()
+
+    def ping(self):
         try:
-            task_to_change = next(task for task in tasks if task['id'] == id_)
-            self._update_task(id_, task, task_to_change)
-        except:
-            raise ValueError("Task was not updated")
+            self.client.admin.command('ping')
+        except errors.PyMongoError as err:
+            print(err)
+            return False
+        return True
 
-    def _update_task(self, id_, task, task_to_change):
-        for key, value in task_to_change.items():
-            for k, new_value in task.items():
-                if key == k and value != new_value:
-                    self.tasks.update({'id': id_}, {'$set': {key: new_value}})
+    def update_task_fields(self, id_, changes, version=None):
+        if changes:
+            query, update = _task_update(id_, changes, version)
+            # the post-image is built from the pre-image so that it does not
+            # depend on the updated document still matching the filter
+            task = self.tasks.find_one_and_update(
+                query, update, projection={'_id': 0},
+                return_document=ReturnDocument.BEFORE)
+            if task is not None:
+                self._record_task_change([id_], done=_done_change(task, changes))
+                return _post_image(task, update)
+        # versions are checked against Mongo, a cached copy may be another
+        # worker's write behind
+        return _check_version(self._find_task(id_), version)
 
     def remove_task(self, task):
         id_ = task['id']
-        task_to_remove = self.retrieve_task_with_id(id_)
+        task_to_remove = self._find_task(id_)
         if task_to_remove == task:
             self.tasks.remove({'id': id_})
+            self._record_task_change([id_], -1, -_done_count(task_to_remove))
         else:
             raise ValueError("Task was not found!")
 
     def remove_task_by_id(self, id_):
-        self.tasks.remove({'id': id_})
+        task = self.tasks.find_one_and_delete({'id': id_},
+                                              projection={'_id': 0, 'done': 1})
+        if task is None:
+            return False
+        self._record_task_change([id_], -1, -_done_count(task))
+        return True
 
     def add_task_to_db(self, task):
         self.tasks.insert_one(task)
+        self._record_task_change([task.get('id')], 1, _done_count(task))
+
+    def retrieve_task_changes(self):
+        changes = self.counters.find_one({'_id': 'task_changes'})
+        seq, updated_at = (0, None) if changes is None else \
+            (changes['seq'], changes['updated_at'])
+        # another worker wrote to the collection since we last looked
+        if seq != self._seen_task_changes:
+            self.invalidate_task_cache()
+            self._seen_task_changes = seq
+        return seq, updated_at
+
+    def retrieve_task_stats(self):
+        changes = self.counters.find_one({'_id': 'task_changes'})
+        if _counts_are_fresh(changes):
+            return _task_stats(changes['total'], changes['done'])
+        return self.rebuild_task_stats()
+
+    def rebuild_task_stats(self):
+        changes = self.counters.find_one({'_id': 'task_changes'})
+        seq = 0 if changes is None else changes['seq']
+        total, done = self.count_tasks()
+        try:
+            # the counts are only kept if no write happened while counting
+            self.counters.update_one(
+                {'_id': 'task_changes', 'seq': seq},
+                {'$set': {'total': total, 'done': done, 'counted': True,
+                          'counted_at': _now()},
+                 '$setOnInsert': {'updated_at': None}}, upsert=True)
+        except errors.DuplicateKeyError:
+            pass
+        return _task_stats(total, done)
+
+    def count_tasks(self):
+        done = next(self.tasks.aggregate([{'$match': {'done': True}},
+                                          {'$count': 'done'}]), {'done': 0})
+        return self.tasks.count_documents({}), done['done']
+
+    def _record_task_change(self, ids=None, total=0, done=0):
+        # the task counts ride along with the change sequence, so reading the
+        # statistics is a single document lookup
+        self.invalidate_task_cache(ids)
+        changes = self.counters.find_one_and_update(
+            {'_id': 'task_changes'},
+            {'$inc': {'seq': 1, 'total': total, 'done': done},
+             '$set': {'updated_at': _now()}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        if changes['seq'] == (self._seen_task_changes or 0) + 1:
+            # nobody else wrote in between, so the cache is still coherent
+            self._seen_task_changes = changes['seq']
+
+    def insert_new_task(self, task):
+        task.setdefault('version', 0)
+        task['updated_at'] = _now()
+        while True:
+            task['id'] = self.next_task_id()
+            try:
+                self.add_task_to_db(task)
+                # insert_one stores the generated ObjectId on the dict itself
+                task.pop('_id', None)
+                return task
+            except errors.DuplicateKeyError:
+                # tasks were inserted with explicit ids behind the counter's back
+                task.pop('_id', None)
+                self._sync_task_id_counter()
+
+    def reserve_task_ids(self, count):
+        counter = self.counters.find_one_and_update(
+            {'_id': 'tasks'}, {'$inc': {'seq': count}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        return counter['seq'] - count + 1
+
+    def _reserve_unused_task_ids(self, count):
+        while True:
+            first_id = self.reserve_task_ids(count)
+            if self.tasks.find_one({'id': {'$gte': first_id}}, {'_id': 0, 'id': 1}) is None:
+                return first_id
+            self._sync_task_id_counter()
+
+    def apply_task_operations(self, operations, ordered=True):
+        ids = [op['id'] for op in operations if op['op'] != 'create']
+        known = dict((task['id'], task) for task in
+                     self.tasks.find({'id': {'$in': ids}}, {'_id': 0}))
+        creates = sum(1 for op in operations if op['op'] == 'create')
+        next_id = self._reserve_unused_task_ids(creates) if creates else None
+        results, requests, request_items, deltas = self._plan_task_operations(
+            operations, ordered, known, next_id)
+        if requests:
+            try:
+                counts = self.tasks.bulk_write(requests, ordered=ordered).bulk_api_result
+            except errors.BulkWriteError as err:
+                _report_write_errors(err, ordered, results, request_items)
+                counts = err.details
+            lost = _lost_write_count(counts, results, request_items)
+            if lost:
+                self._report_lost_writes(operations, results, request_items)
+            self._record_task_change(
+                None, *_applied_deltas(results, request_items, deltas))
+            if lost:
+                self._recount_task_stats()
+        return results
+
+    def _report_lost_writes(self, operations, results, request_items):
+        # a task changed or went away between the read and the write; the
+        # write totals do not say which, so every planned item is checked
+        ids = [operations[item]['id'] for item in request_items
+               if operations[item]['op'] != 'create']
+        current = dict((task['id'], task) for task in self.tasks.find(
+            {'id': {'$in': ids}}, {'_id': 0}))
+        _mark_lost_writes(operations, results, request_items, current)
+
+    def _recount_task_stats(self):
+        # a removal done by someone else would otherwise be counted twice
+        self.counters.update_one({'_id': 'task_changes'}, {'$unset': {'counted': ''}})
+
+    def _plan_task_operations(self, operations, ordered, known, next_id):
+        now = _now()
+        results, requests, request_items, deltas = [], [], [], []
+        for item, op in enumerate(operations):
+            if ordered and results and results[-1]['status'] >= 400:
+                results.append({'status': 424})
+                continue
+            if op['op'] == 'create':
+                task = dict(op['task'], id=next_id, version=0, updated_at=now)
+                next_id += 1
+                known[task['id']] = task
+                result, request = {'status': 201, 'task': task}, InsertOne(dict(task))
+                delta = (1, _done_count(task))
+            elif op['op'] == 'update':
+                result, request, delta = self._plan_task_update(op, known, now)
+            else:
+                result, request, delta = self._plan_task_removal(op, known)
+            results.append(result)
+            if request is not None:
+                requests.append(request)
+                request_items.append(item)
+                deltas.append(delta)
+        return results, requests, request_items, deltas
+
+    def _plan_task_update(self, op, known, now):
+        task = known.get(op['id'])
+        if task is None:
+            return {'status': 404}, None, None
+        version = op.get('version')
+        if version is not None and task.get('version', 0) != version:
+            return {'status': 409}, None, None
+        changes = dict((key, value) for key, value in op['changes'].items()
+                       if task.get(key) != value)
+        if not changes:
+            return {'status': 200, 'task': task}, None, None
+        # conditional on the task as it was read, so a task changed since
+        # then is left alone and reported as a conflict
+        query, update = _task_update(op['id'], changes, now=now)
+        query.update(_as_read(task))
+        delta = (0, _done_change(task, changes))
+        task = known[op['id']] = _post_image(dict(task), update)
+        return {'status': 200, 'task': task}, UpdateOne(query, update), delta
+
+    def _plan_task_removal(self, op, known):
+        task = known.pop(op['id'], None)
+        if task is None:
+            return {'status': 404}, None, None
+        request = DeleteOne(_as_read(task))
+        return {'status': 200}, request, (-1, -_done_count(task))
+
+    def _sync_task_id_counter(self):
+        highest = self.tasks.find_one({}, {'_id': 0, 'id': 1},
+                                      sort=[('id', DESCENDING)])
+        if highest is not None:
+            self.counters.update_one({'_id': 'tasks'},
+                                     {'$max': {'seq': highest['id']}},
+                                     upsert=True)
+        with self._id_lock:
+            self._reset_task_id_block()
 
     def insert_user_to_db(self, user_info):
         self.users.insert_one(user_info)
@@ -66,30 +383,153 @@ class DatabaseHelper(object):
     def retrieve_user_by_username(self, username):
         return self.users.find_one({'username': username}, {'_id': 0})
 
-    def create_non_existing_user_to_database(self, username, password):
-        hash_ = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(ENCRYPTION_ROUNDS))
-        user_info = {'username': username, 'hash': hash_}
-        user = self.retrieve_user_by_username(username)
-        if not user:
-            self.insert_user_to_db(user_info)
+    def retrieve_password_hash_for_user(self, username):
+        user = self.users.find_one({'username': username}, {'_id': 0, 'hash': 1})
+        return user['hash'] if user else None
 
-    def check_password_hash_for_user(self, username, password):
-        try:
-            user = next(user for user in self.users.find({}) if user['username'] == username)
-            return bcrypt.checkpw(password.encode('utf-8'), user['hash'])
-        except StopIteration:
+
+def _task_update(id_, changes, version=None, now=None):
+    query = {'id': id_}
+    if version is not None:
+        query['version'] = _version_match(version)
+    query['$or'] = [{key: {'$ne': value}} for key, value in changes.items()]
+    changes = dict(changes, updated_at=now or _now())
+    return query, {'$set': changes, '$inc': {'version': 1}}
+
+
+def _version_match(version):
+    # tasks written before versioning have no version field
+    return version if version else {'$in': [0, None]}
+
+
+# what a task must still hold for a batch write planned on it to apply;
+# versions alone can repeat when two writers bump the same task at once
+_TASK_STATE = ('title', 'description', 'done', 'updated_at')
+
+
+def _as_read(task):
+    query = {'id': task['id'], 'version': _version_match(task.get('version', 0))}
+    query.update((field, task.get(field)) for field in _TASK_STATE)
+    return query
+
+
+def _post_image(task, update):
+    task.update(update['$set'])
+    task['version'] = task.get('version', 0) + 1
+    return task
+
+
+def _search_pipeline(q, done):
+    match = {'$text': {'$search': q}}
+    if done is not None:
+        match['done'] = done
+    return [{'$match': match},
+            {'$addFields': {'_score': {'$meta': 'textScore'}}}]
+
+
+def _search_page(pipeline, after, position, fields, limit):
+    # pages are keyed on (score, id) the way the listing is keyed on id
+    stages = list(pipeline)
+    if after is not None:
+        score = position['_score']
+        stages.append({'$match': {'$or': [{'_score': {'$lt': score}},
+                                          {'_score': score, 'id': {'$gt': after}}]}})
+    stages.append({'$sort': {'_score': -1, 'id': 1}})
+    if limit is not None:
+        stages.append({'$limit': limit})
+    if fields is None:
+        stages.append({'$project': {'_id': 0, '_score': 0}})
+    else:
+        projection = dict((field, 1) for field in set(fields) | {'id'})
+        stages.append({'$project': dict(projection, _id=0)})
+    return stages
+
+
+def _rank_in_process(tasks, q, fields, after, limit):
+    index, found = InvertedIndex(), {}
+    for task in tasks:
+        index.add(task['id'], task)
+        found[task['id']] = task
+    return [dict((field, value) for field, value in found[id_].items()
+                 if fields is None or field == 'id' or field in fields)
+            for id_ in rank(index.search(q), after, limit)]
+
+
+def _done_count(task):
+    # the same test as the {'done': True} match used when counting
+    return 1 if task.get('done') is True else 0
+
+
+def _done_change(task, changes):
+    if 'done' not in changes:
+        return 0
+    return _done_count(changes) - _done_count(task)
+
+
+def _applied_deltas(results, request_items, deltas):
+    # writes that failed inside the batch must not be counted
+    total = done = 0
+    for item, (total_change, done_change) in zip(request_items, deltas):
+        if results[item]['status'] < 400:
+            total += total_change
+            done += done_change
+    return total, done
+
+
+def _lost_write_count(counts, results, request_items):
+    planned = sum(1 for item in request_items if results[item]['status'] < 400)
+    return planned - counts['nInserted'] - counts['nMatched'] - counts['nRemoved']
+
+
+def _mark_lost_writes(operations, results, request_items, current):
+    for item in request_items:
+        op, result = operations[item], results[item]
+        if op['op'] == 'create' or result['status'] >= 400:
+            continue
+        task = current.get(op['id'])
+        if op['op'] == 'update':
+            applied = task is not None and _same_state(task, result['task'])
+        else:
+            # gone is what was asked for, whoever removed it
+            applied = task is None
+        if not applied:
+            results[item] = {'status': 409}
+
+
+def _same_state(stored, written):
+    if stored.get('version') != written.get('version'):
+        return False
+    for field in _TASK_STATE:
+        value, expected = stored.get(field), written.get(field)
+        if field == 'updated_at' and value is not None and expected is not None:
+            # pymongo hands back naive datetimes that are in UTC
+            value, expected = value.replace(tzinfo=None), expected.replace(tzinfo=None)
+        if value != expected:
             return False
+    return True
+
+
+def _report_write_errors(err, ordered, results, request_items):
+    for error in err.details['writeErrors']:
+        item = request_items[error['index']]
+        status = 409 if error['code'] == 11000 else 500
+        results[item] = {'status': status, 'error': error['errmsg']}
+        if ordered:
+            for later in request_items[error['index'] + 1:]:
+                results[later] = {'status': 424}
 
 
 class TestDB(DatabaseHelper):
-    def __init__(self):
-        try:
-            self.client = MongoClient()
-            self.db = self.client.test
-            self.tasks = self.db.tasks
-            self.users = self.db.users
-        except errors.ServerSelectionTimeoutError as err:
-            print(err)
+    # mongomock and other stand-ins have no $text operator
+    text_search = False
+    encryption_rounds = 4  # hashing at production cost would only slow tests
+
+    def __init__(self, task_cache=False, **options):
+        # tests change the collections directly, behind the cache's back.
+        # Takes the same options as the other backends, but whatever database
+        # they name, tests only ever touch 'test'
+        options.pop('database_name', None)
+        super(TestDB, self).__init__('test', task_cache=task_cache, **options)
 
     def create_test_users_to_test_db(self):
         self.create_non_existing_user_to_database('mojo', 'python')
@@ -97,6 +537,7 @@ class TestDB(DatabaseHelper):
 
     def remove_test_users_from_db(self):
         self.users.remove({})
+        self.verified_credentials.clear()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,6 @@
+import os
+
+bind = os.environ.get('BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+# import wsgi.py in the master; see there for what is and is not preloaded
+preload_app = True
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+# bcrypt releases the GIL while hashing, so threads use every core
+KDF_THREADS = int(os.environ.get('KDF_THREADS', os.cpu_count() or 1))
+KDF_QUEUE_DEPTH = int(os.environ.get('KDF_QUEUE_DEPTH', KDF_THREADS * 4))
+KDF_RETRY_AFTER = 1  # seconds
+
+
+class KDFOverloadedError(Exception):
+    def __init__(self, retry_after=KDF_RETRY_AFTER):
+        super(KDFOverloadedError, self).__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+class KDFExecutor(object):
+    def __init__(self, threads=KDF_THREADS, queue_depth=KDF_QUEUE_DEPTH,
+                 retry_after=KDF_RETRY_AFTER):
+        self.threads = threads
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._start()
+        self.completed = 0
+        self.rejected = 0
+        self.queue_wait = 0.0
+        self.max_queue_wait = 0.0
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._executor = ThreadPoolExecutor(self.threads)
+        # running plus waiting jobs; anything beyond is turned away at once
+        self._slots = threading.BoundedSemaphore(self.threads + self.queue_depth)
+
+    def submit(self, function, *args):
+        if self._pid != os.getpid():
+            # pool threads do not survive a fork
+            self._start()
+        if not self._slots.acquire(False):
+            with self._lock:
+                self.rejected += 1
+            raise KDFOverloadedError(self.retry_after)
+        submitted = time.monotonic()
+
+        def job():
+            waited = time.monotonic() - submitted
+            with self._lock:
+                self.queue_wait += waited
+                self.max_queue_wait = max(self.max_queue_wait, waited)
+            try:
+                return function(*args)
+            finally:
+                with self._lock:
+                    self.completed += 1
+                slots.release()
+
+        slots = self._slots
+        try:
+            return self._executor.submit(job)
+        except RuntimeError:
+            slots.release()
+            raise
+
+    def run(self, function, *args):
+        started = time.monotonic()
+        try:
+            return self.submit(function, *args).result()
+        finally:
+            metrics.record('kdf', time.monotonic() - started)
+
+    def statistics(self):
+        with self._lock:
+            return {'threads': self.threads,
+                    'queue_depth': self.queue_depth,
+                    'completed': self.completed,
+                    'rejected': self.rejected,
+                    'queue_wait_seconds': self.queue_wait,
+                    'max_queue_wait_seconds': self.max_queue_wait}
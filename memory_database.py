@@ -0,0 +1,280 @@
+import bisect
+import threading
+
+from search import InvertedIndex, SEARCH_FIELDS, rank
+from storage import Storage, _MISSING, _check_version, _now, _task_stats, \
+    TASK_ID_BLOCK_SIZE
+
+TASK_SLOTS = ('id', 'title', 'description', 'done', 'version', 'updated_at')
+_TASK_SLOT_SET = frozenset(TASK_SLOTS)
+
+
+class TaskRecord(object):
+    # fields outside TASK_SLOTS are rare, so they live in an optional dict
+    __slots__ = TASK_SLOTS + ('extra',)
+
+    def __init__(self, task):
+        self.extra = None
+        for field in TASK_SLOTS:
+            setattr(self, field, task.get(field, _MISSING))
+        self.update((field, value) for field, value in task.items()
+                    if field not in _TASK_SLOT_SET and field != '_id')
+
+    def get(self, field, default=None):
+        if field in _TASK_SLOT_SET:
+            value = getattr(self, field)
+        else:
+            value = self.extra.get(field, _MISSING) if self.extra else _MISSING
+        return default if value is _MISSING else value
+
+    def update(self, changes):
+        for field, value in changes:
+            if field in _TASK_SLOT_SET:
+                setattr(self, field, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[field] = value
+
+    def as_dict(self, fields=None):
+        task = {}
+        for field in TASK_SLOTS:
+            value = getattr(self, field)
+            if value is not _MISSING and \
+                    (fields is None or field == 'id' or field in fields):
+                task[field] = value
+        if self.extra:
+            for field, value in self.extra.items():
+                if fields is None or field in fields:
+                    task[field] = value
+        return task
+
+
+# keeps everything in this process: for edge caches and fast test runs, not
+# for sharing tasks between workers
+class MemoryDatabaseHelper(Storage):
+    def __init__(self, database_name='production',
+                 id_block_size=TASK_ID_BLOCK_SIZE, task_cache=False, kdf=None):
+        self.database_name = database_name
+        # reads are already dictionary lookups, so the task cache is never used
+        super(MemoryDatabaseHelper, self).__init__(id_block_size, False, kdf)
+        self._lock = threading.RLock()
+        self._sequence_lock = threading.Lock()
+        self._tasks = {}
+        self._ids = []  # sorted, so pages can start right after an id
+        self._titles = {}
+        self._words = InvertedIndex()
+        self._done = 0
+        self._users = {}
+        self._task_id_seq = 0
+        self._task_changes = (0, None)
+
+    def retrieve_tasks(self, done=None, fields=None, after=None, limit=None,
+                       batch_size=None, q=None):
+        if q is not None:
+            return self.search_tasks(q, done, fields, after, limit)
+        tasks = []
+        with self._lock:
+            start = 0 if after is None else bisect.bisect_right(self._ids, after)
+            for index in range(start, len(self._ids)):
+                record = self._tasks[self._ids[index]]
+                if done is not None and record.done != done:
+                    continue
+                tasks.append(record.as_dict(fields))
+                if limit is not None and len(tasks) == limit:
+                    break
+        return tasks
+
+    def search_tasks(self, q, done=None, fields=None, after=None, limit=None):
+        with self._lock:
+            scores = self._words.search(q)
+            if done is not None:
+                scores = dict((id_, score) for id_, score in scores.items()
+                              if self._tasks[id_].done == done)
+            return [self._tasks[id_].as_dict(fields)
+                    for id_ in rank(scores, after, limit)]
+
+    def retrieve_task_with_title(self, title):
+        with self._lock:
+            ids = self._titles.get(title)
+            return self._tasks[min(ids)].as_dict() if ids else None
+
+    def retrieve_task_with_id(self, id_):
+        with self._lock:
+            record = self._tasks.get(id_)
+            return None if record is None else record.as_dict()
+
+    def listen_for_task_changes(self, logger=None):
+        # every write goes through this process, there is nothing to listen to
+        return None
+
+    def ping(self):
+        return True
+
+    def update_task_fields(self, id_, changes, version=None):
+        with self._lock:
+            record = self._tasks.get(id_)
+            if record is None:
+                return None
+            _check_version(record.as_dict(), version)
+            if self._update_record(record, changes, _now()):
+                self._record_task_change()
+            return record.as_dict()
+
+    def _update_record(self, record, changes, now):
+        if all(record.get(field, _MISSING) == value
+               for field, value in changes.items()):
+            return False
+        if 'title' in changes:
+            self._unindex_title(record)
+        self._done -= 1 if record.done is True else 0
+        record.update(changes.items())
+        self._done += 1 if record.done is True else 0
+        record.update([('updated_at', now),
+                       ('version', record.get('version', 0) + 1)])
+        self._titles.setdefault(record.title, set()).add(record.id)
+        if any(field in changes for field in SEARCH_FIELDS):
+            self._words.add(record.id, record.as_dict(SEARCH_FIELDS))
+        return True
+
+    def remove_task(self, task):
+        with self._lock:
+            if self.retrieve_task_with_id(task['id']) != task:
+                raise ValueError("Task was not found!")
+            self.remove_task_by_id(task['id'])
+
+    def remove_task_by_id(self, id_):
+        with self._lock:
+            if not self._remove_record(id_):
+                return False
+            self._record_task_change()
+            return True
+
+    def _remove_record(self, id_):
+        record = self._tasks.pop(id_, None)
+        if record is None:
+            return False
+        del self._ids[bisect.bisect_left(self._ids, id_)]
+        self._unindex_title(record)
+        self._words.remove(id_)
+        self._done -= 1 if record.done is True else 0
+        return True
+
+    def _unindex_title(self, record):
+        ids = self._titles.get(record.title)
+        if ids is not None:
+            ids.discard(record.id)
+            if not ids:
+                del self._titles[record.title]
+
+    def add_task_to_db(self, task):
+        with self._lock:
+            self._add_record(task)
+            self._record_task_change()
+
+    def _add_record(self, task):
+        if task.get('id') in self._tasks:
+            raise ValueError("Task id already exists")
+        record = TaskRecord(task)
+        self._tasks[record.id] = record
+        bisect.insort(self._ids, record.id)
+        self._titles.setdefault(record.title, set()).add(record.id)
+        self._words.add(record.id, task)
+        self._done += 1 if record.done is True else 0
+
+    def retrieve_task_changes(self):
+        return self._task_changes
+
+    def retrieve_task_stats(self):
+        with self._lock:
+            return _task_stats(len(self._tasks), self._done)
+
+    def _record_task_change(self):
+        self._task_changes = (self._task_changes[0] + 1, _now())
+
+    def insert_new_task(self, task):
+        task.setdefault('version', 0)
+        task['updated_at'] = _now()
+        with self._lock:
+            task['id'] = self.next_task_id()
+            while task['id'] in self._tasks:
+                # tasks were added with explicit ids behind the counter's back
+                self._sync_task_id_counter()
+                task['id'] = self.next_task_id()
+            self.add_task_to_db(task)
+        return task
+
+    def reserve_task_ids(self, count):
+        with self._sequence_lock:
+            self._task_id_seq += count
+            return self._task_id_seq - count + 1
+
+    def _reserve_unused_task_ids(self, count):
+        first_id = self.reserve_task_ids(count)
+        if self._ids and self._ids[-1] >= first_id:
+            self._sync_task_id_counter()
+            first_id = self.reserve_task_ids(count)
+        return first_id
+
+    def _sync_task_id_counter(self):
+        with self._lock:
+            if self._ids:
+                with self._sequence_lock:
+                    self._task_id_seq = max(self._task_id_seq, self._ids[-1])
+        with self._id_lock:
+            self._reset_task_id_block()
+
+    def apply_task_operations(self, operations, ordered=True):
+        now = _now()
+        results, changed = [], False
+        with self._lock:
+            creates = sum(1 for op in operations if op['op'] == 'create')
+            next_id = self._reserve_unused_task_ids(creates) if creates else None
+            for op in operations:
+                if ordered and results and results[-1]['status'] >= 400:
+                    results.append({'status': 424})
+                    continue
+                if op['op'] == 'create':
+                    task = dict(op['task'], id=next_id, version=0, updated_at=now)
+                    next_id += 1
+                    self._add_record(task)
+                    result, changed = {'status': 201, 'task': task}, True
+                elif op['op'] == 'update':
+                    result, updated = self._apply_task_update(op, now)
+                    changed = changed or updated
+                elif self._remove_record(op['id']):
+                    result, changed = {'status': 200}, True
+                else:
+                    result = {'status': 404}
+                results.append(result)
+            if changed:
+                self._record_task_change()
+        return results
+
+    def _apply_task_update(self, op, now):
+        record = self._tasks.get(op['id'])
+        if record is None:
+            return {'status': 404}, False
+        version = op.get('version')
+        if version is not None and record.get('version', 0) != version:
+            return {'status': 409}, False
+        updated = self._update_record(record, op['changes'], now)
+        return {'status': 200, 'task': record.as_dict()}, updated
+
+    def insert_user_to_db(self, user_info):
+        with self._lock:
+            if user_info['username'] in self._users:
+                raise ValueError("User already exists")
+            self._users[user_info['username']] = dict(user_info)
+
+    def retrieve_users(self):
+        with self._lock:
+            return [dict(user) for user in self._users.values()]
+
+    def retrieve_user_by_username(self, username):
+        user = self._users.get(username)
+        return None if user is None else dict(user)
+
+    def retrieve_password_hash_for_user(self, username):
+        user = self._users.get(username)
+        return user['hash'] if user else None
@@ -0,0 +1,189 @@
+import bisect
+import os
+import threading
+import time
+
+from flask import Response, abort, request
+from pymongo import monitoring
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 1000)
+SLOW_REQUEST_SECONDS = float(os.environ.get('METRICS_SLOW_REQUEST_SECONDS', 1.0))
+
+
+class Histogram(object):
+    def __init__(self, name, help_, label_names=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help_
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help),
+                 '# TYPE %s histogram' % self.name]
+        with self._lock:
+            series = sorted(self._series.items())
+        for labels, (counts, total, count) in series:
+            pairs = ['%s="%s"' % (name, _escape(value))
+                     for name, value in zip(self.label_names, labels)]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append('%s_bucket{%s} %d' % (
+                    self.name, ','.join(pairs + ['le="%s"' % bound]), cumulative))
+            lines.append('%s_bucket{%s} %d' % (
+                self.name, ','.join(pairs + ['le="+Inf"']), count))
+            label_text = '{%s}' % ','.join(pairs) if pairs else ''
+            lines.append('%s_sum%s %r' % (self.name, label_text, total))
+            lines.append('%s_count%s %d' % (self.name, label_text, count))
+        return lines
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.metrics.record('mongo', event.duration_micros / 1e6,
+                            event.command_name)
+
+    def failed(self, event):
+        self.metrics.record('mongo', event.duration_micros / 1e6,
+                            event.command_name)
+
+
+class Metrics(object):
+    def __init__(self, enabled=False, slow_request_seconds=SLOW_REQUEST_SECONDS):
+        self.enabled = enabled
+        self.slow_request_seconds = slow_request_seconds
+        self.requests = Histogram('todo_request_duration_seconds',
+                                  'Request latency by route.',
+                                  ('route', 'method', 'status'))
+        self.mongo_operations = Histogram('todo_mongo_operation_duration_seconds',
+                                          'Mongo command latency.', ('command',))
+        self.mongo_per_request = Histogram('todo_mongo_operations_per_request',
+                                           'Mongo commands issued per request.',
+                                           ('route', 'method'), COUNT_BUCKETS)
+        self.kdf = Histogram('todo_kdf_duration_seconds',
+                             'Password hashing time including queue wait.')
+        self.serialization = Histogram('todo_serialization_duration_seconds',
+                                       'JSON serialization time.')
+        self.command_listener = MongoCommandListener(self)
+        self._collectors = []
+        self._local = threading.local()
+
+    def add_collector(self, collector):
+        # collector() returns (name, help, value) tuples rendered as gauges
+        self._collectors.append(collector)
+
+    def record(self, kind, seconds, name=None):
+        if not self.enabled:
+            return
+        if kind == 'mongo':
+            self.mongo_operations.observe(seconds, name)
+        elif kind == 'kdf':
+            self.kdf.observe(seconds)
+        else:
+            self.serialization.observe(seconds)
+        operations = getattr(self._local, 'operations', None)
+        if operations is not None:
+            operations.append((kind, name, seconds))
+
+    def start_request(self):
+        self._local.operations = []
+        self._local.started = time.monotonic()
+
+    def finish_request(self, route, method, status):
+        operations = getattr(self._local, 'operations', None)
+        if operations is None:
+            return None
+        self._local.operations = None
+        duration = time.monotonic() - self._local.started
+        self.requests.observe(duration, route, method, str(status))
+        self.mongo_per_request.observe(
+            sum(1 for kind, _, _ in operations if kind == 'mongo'), route, method)
+        return duration, operations
+
+    def render(self):
+        lines = []
+        for histogram in (self.requests, self.mongo_operations,
+                          self.mongo_per_request, self.kdf, self.serialization):
+            lines.extend(histogram.render())
+        for collector in self._collectors:
+            for name, help_, value in collector():
+                lines.extend(['# HELP %s %s' % (name, help_),
+                              '# TYPE %s gauge' % name,
+                              '%s %r' % (name, value)])
+        return '\n'.join(lines) + '\n'
+
+    def init_app(self, app):
+        metrics = self
+
+        # wraps whichever JSON provider the app has installed
+        class TimedJSONProvider(type(app.json)):
+            def dumps(self, obj, **kwargs):
+                started = time.monotonic()
+                try:
+                    return super(TimedJSONProvider, self).dumps(obj, **kwargs)
+                finally:
+                    metrics.record('serialization', time.monotonic() - started)
+
+        app.json = TimedJSONProvider(app)
+
+        @app.before_request
+        def start_request_timer():
+            if self.enabled:
+                self.start_request()
+
+        @app.after_request
+        def stop_request_timer(response):
+            if not self.enabled:
+                return response
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            finished = self.finish_request(route, request.method,
+                                           response.status_code)
+            if finished is not None and finished[0] >= self.slow_request_seconds:
+                app.logger.warning('slow request %s %s took %.3fs: %s',
+                                   request.method, request.path, finished[0],
+                                   describe(finished[1]))
+            return response
+
+        @app.route('/metrics', methods=['GET'])
+        def export_metrics():
+            if not self.enabled:
+                abort(404)
+            return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def describe(operations):
+    totals = {}
+    for kind, name, seconds in operations:
+        key = '%s:%s' % (kind, name) if name else kind
+        count, total = totals.get(key, (0, 0.0))
+        totals[key] = (count + 1, total + seconds)
+    return ', '.join('%s x%d %.3fs' % (key, count, total)
+                     for key, (count, total) in sorted(totals.items())) or 'no operations'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics(enabled=os.environ.get('METRICS_ENABLED') == '1')
@@ -0,0 +1,214 @@
+import functools
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, g, request
+from pymongo import errors
+
+from cache import TTLCache
+from connection import get_client
+
+# requests per second and burst; the per IP bucket is checked before
+# authentication, so it also caps how often anyone can make us run bcrypt
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+RATE_LIMIT_RATE = float(os.environ.get('RATE_LIMIT_RATE', 20))
+RATE_LIMIT_BURST = int(os.environ.get('RATE_LIMIT_BURST', 40))
+# off unless asked for: behind a proxy every client shares the proxy's
+# address, so set TRUSTED_PROXIES to the number of proxies in front first
+IP_RATE_LIMIT_ENABLED = os.environ.get('IP_RATE_LIMIT_ENABLED', '0') != '0'
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+IP_RATE_LIMIT_RATE = float(os.environ.get('IP_RATE_LIMIT_RATE', 50))
+IP_RATE_LIMIT_BURST = int(os.environ.get('IP_RATE_LIMIT_BURST', 100))
+# "memory" keeps buckets per process, "mongo" shares them between workers
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')
+RATE_LIMIT_DATABASE = os.environ.get('MONGO_DATABASE', 'production')
+# requests served at once by one process, 0 for no limit
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', 64))
+OVERLOAD_RETRY_AFTER = 1  # seconds
+BUCKET_STORE_SIZE = 100000
+BUCKET_STORE_TTL = 3600  # seconds
+SHARED_BUCKET_ATTEMPTS = 3
+
+
+class RateLimitedError(Exception):
+    def __init__(self, retry_after):
+        super(RateLimitedError, self).__init__("Too many requests")
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class OverloadedError(Exception):
+    def __init__(self, retry_after=OVERLOAD_RETRY_AFTER):
+        super(OverloadedError, self).__init__("Too many requests in progress")
+        self.retry_after = retry_after
+
+
+class MemoryBucketStore(object):
+    def __init__(self, maxsize=BUCKET_STORE_SIZE, ttl=BUCKET_STORE_TTL):
+        # an evicted bucket simply starts out full again
+        self._buckets = TTLCache(maxsize, ttl, clock=time.time)
+        self._lock = threading.Lock()
+
+    def update(self, key, compute):
+        with self._lock:
+            state, retry_after = compute(self._buckets.get(key))
+            if state is not None:
+                self._buckets.set(key, state)
+            return retry_after
+
+
+class MongoBucketStore(object):
+    def __init__(self, database_name=RATE_LIMIT_DATABASE, ttl=BUCKET_STORE_TTL):
+        self.database_name = database_name
+        self.ttl = ttl
+        self._indexed = False
+
+    @property
+    def collection(self):
+        # looked up per use, so no client is opened before a server forks
+        return get_client()[self.database_name].rate_limits
+
+    def _create_index(self):
+        try:
+            self.collection.create_index('expires_at', expireAfterSeconds=0)
+            self._indexed = True
+        except errors.ServerSelectionTimeoutError as err:
+            print(err)
+
+    def update(self, key, compute):
+        if not self._indexed:
+            self._create_index()
+        # compare and set on the stored state, like the versioned task updates
+        for _ in range(SHARED_BUCKET_ATTEMPTS):
+            bucket = self.collection.find_one({'_id': key})
+            old = None if bucket is None else bucket['tat']
+            state, retry_after = compute(old)
+            if state is None:
+                return retry_after
+            document = {'tat': state,
+                        'expires_at': datetime.now(timezone.utc) +
+                        timedelta(seconds=self.ttl)}
+            if bucket is None:
+                try:
+                    self.collection.insert_one(dict(document, _id=key))
+                    return 0
+                except errors.DuplicateKeyError:
+                    continue
+            if self.collection.update_one({'_id': key, 'tat': old},
+                                          {'$set': document}).matched_count:
+                return 0
+        # the bucket is too hot to win a write, which is an answer in itself
+        return retry_after or 1
+
+
+class TokenBucket(object):
+    # kept as the time the bucket will be full again (GCRA), so a bucket is
+    # one number that is easy to store and compare anywhere
+    def __init__(self, name, rate, burst, store, clock=time.time):
+        self.name = name
+        self.interval = 1.0 / rate
+        self.capacity = burst * self.interval
+        self.store = store
+        self.clock = clock
+
+    def acquire(self, key):
+        def compute(full_at):
+            now = self.clock()
+            full_at = max(full_at or now, now) + self.interval
+            if full_at - now > self.capacity:
+                return None, full_at - now - self.capacity
+            return full_at, 0
+
+        retry_after = self.store.update('%s:%s' % (self.name, key), compute)
+        if retry_after:
+            raise RateLimitedError(retry_after)
+
+
+def bucket_store_from_env():
+    if RATE_LIMIT_STORE == 'mongo':
+        return MongoBucketStore()
+    return MemoryBucketStore()
+
+
+class Limiter(object):
+    def __init__(self, key, store=None, rate=RATE_LIMIT_RATE,
+                 burst=RATE_LIMIT_BURST, ip_rate=IP_RATE_LIMIT_RATE,
+                 ip_burst=IP_RATE_LIMIT_BURST,
+                 max_concurrent=MAX_CONCURRENT_REQUESTS):
+        self.key = key
+        self.store = store or MemoryBucketStore()
+        self.rate = rate
+        self.burst = burst
+        self.ip_bucket = TokenBucket('ip', ip_rate, ip_burst, self.store)
+        self.max_concurrent = max_concurrent
+        self._slots = threading.BoundedSemaphore(max_concurrent) \
+            if max_concurrent else None
+        self._exempt = set()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rate_limited = 0
+        self.shed = 0
+
+    def init_app(self, app):
+        app.config.setdefault('RATE_LIMIT_ENABLED', RATE_LIMIT_ENABLED)
+        app.config.setdefault('IP_RATE_LIMIT_ENABLED', IP_RATE_LIMIT_ENABLED)
+
+        @app.before_request
+        def admit_request():
+            if request.endpoint in self._exempt:
+                return
+            # load is shed here, before any database or bcrypt work
+            if self._slots is not None:
+                if not self._slots.acquire(blocking=False):
+                    self._count('shed')
+                    raise OverloadedError()
+                g.request_slot = True
+                self._count('in_flight')
+            if current_app.config['RATE_LIMIT_ENABLED'] and \
+                    current_app.config['IP_RATE_LIMIT_ENABLED']:
+                self._acquire(self.ip_bucket, request.remote_addr)
+
+        @app.teardown_request
+        def release_request(exception=None):
+            if g.pop('request_slot', False):
+                self._count('in_flight', -1)
+                self._slots.release()
+
+    def limit(self, rate=None, burst=None):
+        # routes without their own rate share one bucket per user
+        def decorator(view):
+            bucket = TokenBucket(view.__name__ if rate else 'user',
+                                 rate or self.rate, burst or self.burst, self.store)
+
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if current_app.config['RATE_LIMIT_ENABLED']:
+                    self._acquire(bucket, self.key())
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def exempt(self, view):
+        # for health checks, which must answer even when the server is busy
+        self._exempt.add(view.__name__)
+        return view
+
+    def _acquire(self, bucket, key):
+        try:
+            bucket.acquire(key)
+        except RateLimitedError:
+            self._count('rate_limited')
+            raise
+
+    def _count(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def statistics(self):
+        with self._lock:
+            return {'in_flight': self.in_flight,
+                    'max_concurrent': self.max_concurrent,
+                    'rate_limited': self.rate_limited,
+                    'shed': self.shed}
@@ -0,0 +1,51 @@
+import hashlib
+from datetime import timezone
+
+# conditional requests and content negotiation, shared by app.py and
+# async_app.py; request and response are whatever the framework hands over,
+# both are werkzeug based
+
+
+def is_not_modified(request, etag, last_modified):
+    if request.if_none_match:
+        # weak comparison, a compressed response carries the tag as W/"..."
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def representation_tag(request, extra=b''):
+    # bodies carry absolute uris built from the host, so the host is part of
+    # every tag
+    variant = hashlib.sha1(request.host_url.encode('utf-8') + extra)
+    return variant.hexdigest()[:16]
+
+
+def add_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
+def as_utc(timestamp):
+    # pymongo hands back naive datetimes that are in UTC
+    if timestamp is not None and timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def wants_stream(request):
+    if request.args.get('stream') == '1':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json',
+                                                'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+
+def vary_on_accept(response):
+    # the listing is JSON or ndjson depending on Accept, so a cache has to
+    # keep one copy per Accept header
+    response.vary.add('Accept')
+    return response
@@ -0,0 +1,66 @@
+import re
+
+SEARCH_FIELDS = ('title', 'description')
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower()) if text else []
+
+
+def parse_query(query):
+    # like Mongo's $search: any term matches, a leading "-" excludes a term
+    terms, excluded = set(), set()
+    for word in query.split():
+        target = excluded if word.startswith('-') else terms
+        target.update(tokenize(word))
+    return terms, excluded
+
+
+class InvertedIndex(object):
+    def __init__(self):
+        self._postings = {}  # term -> {id: occurrences}
+        self._terms = {}  # id -> terms, to unindex a task without its text
+
+    def __len__(self):
+        return len(self._terms)
+
+    def add(self, id_, task):
+        self.remove(id_)
+        counts = {}
+        for field in SEARCH_FIELDS:
+            for term in tokenize(task.get(field)):
+                counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            self._postings.setdefault(term, {})[id_] = count
+        self._terms[id_] = set(counts)
+
+    def remove(self, id_):
+        for term in self._terms.pop(id_, ()):
+            postings = self._postings[term]
+            del postings[id_]
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query):
+        terms, excluded = parse_query(query)
+        scores = {}
+        for term in terms:
+            for id_, count in self._postings.get(term, {}).items():
+                scores[id_] = scores.get(id_, 0) + count
+        for term in excluded:
+            for id_ in self._postings.get(term, ()):
+                scores.pop(id_, None)
+        return scores
+
+
+def rank(scores, after=None, limit=None):
+    # best score first, then id; a page starts right after the task `after`
+    # held in that order, which is gone if the task no longer matches
+    ids = sorted(scores, key=lambda id_: (-scores[id_], id_))
+    if after is not None:
+        if after not in scores:
+            return []
+        ids = ids[ids.index(after) + 1:]
+    return ids if limit is None else ids[:limit]
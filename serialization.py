@@ -0,0 +1,42 @@
+import json
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# "orjson" when it is installed, "json" forces the standard library encoder
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'orjson' if orjson else 'json')
+if JSON_ENCODER == 'orjson' and orjson is None:
+    raise RuntimeError("JSON_ENCODER=orjson but orjson is not installed")
+
+
+def public_task(task, uri_prefix):
+    # a C level copy and two pops beat rebuilding the dict field by field
+    public = dict(task)
+    public.pop('updated_at', None)
+    id_ = public.pop('id', None)
+    if id_ is not None:
+        public['uri'] = uri_prefix + str(id_)
+    return public
+
+
+def public_tasks(tasks, uri_prefix):
+    return [public_task(task, uri_prefix) for task in tasks]
+
+
+def dumps(obj, default=None):
+    if JSON_ENCODER == 'orjson':
+        return orjson.dumps(obj, default=default).decode('utf-8')
+    return json.dumps(obj, default=default, separators=(',', ':'))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # responses are compact and unsorted unless indentation was asked for
+    def dumps(self, obj, **kwargs):
+        if JSON_ENCODER == 'orjson' and set(kwargs) <= {'separators'}:
+            return dumps(obj, default=self.default)
+        return super(FastJSONProvider, self).dumps(obj, **kwargs)
@@ -0,0 +1,261 @@
+import abc, bcrypt, hashlib, hmac, importlib, os, threading
+from datetime import datetime, timedelta, timezone
+
+from cache import TTLCache
+from kdf import KDFExecutor
+
+
+PRODUCTION_ENCRYPTION_ROUNDS = 12
+ENCRYPTION_ROUNDS = int(os.environ.get('ENCRYPTION_ROUNDS',
+                                       PRODUCTION_ENCRYPTION_ROUNDS))
+
+CREDENTIAL_CACHE_SIZE = 1024
+CREDENTIAL_CACHE_TTL = 300  # seconds
+# ids handed out per reservation; larger blocks mean fewer round trips for
+# inserts but leave gaps in the ids when a worker exits
+TASK_ID_BLOCK_SIZE = int(os.environ.get('TASK_ID_BLOCK_SIZE', 1))
+# off unless asked for: single task reads do not check the change sequence,
+# so with several workers the cache is only coherent while the change
+# stream listener runs, which needs a replica set
+TASK_CACHE_ENABLED = os.environ.get('TASK_CACHE_ENABLED', '0') != '0'
+TASK_CACHE_SIZE = 4096
+TASK_CACHE_TTL = 5  # seconds
+# a change stream that fails is reopened after this delay, doubled after
+# every failure in a row
+TASK_LISTENER_RETRY_DELAY = 1  # seconds
+TASK_LISTENER_MAX_RETRY_DELAY = 60  # seconds
+# a task write and its $inc on the counts are two operations, so a rebuild
+# landing between them, or a crash, leaves the counts off; they are recounted
+# from the collection at least this often
+TASK_STATS_RECOUNT_INTERVAL = 60  # seconds
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+# backend name -> "module:class", imported when the backend is first used
+BACKENDS = {
+    'mongo': 'database:DatabaseHelper',
+    'memory': 'memory_database:MemoryDatabaseHelper',
+    'test': 'database:TestDB',
+}
+
+
+class VersionConflictError(ValueError):
+    pass
+
+
+def register_backend(name, factory):
+    BACKENDS[name] = factory
+
+
+def create_storage(backend=None, **options):
+    backend = backend or STORAGE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError("Unknown storage backend %r" % backend)
+    factory = BACKENDS[backend]
+    if isinstance(factory, str):
+        module, _, name = factory.partition(':')
+        factory = getattr(importlib.import_module(module), name)
+    return factory(**options)
+
+
+# what app.py needs from a backend; the task cache, id blocks and password
+# checks are shared, everything that touches stored data is per backend. A
+# backend that misses a method cannot be created at all
+class Storage(abc.ABC):
+    encryption_rounds = ENCRYPTION_ROUNDS
+
+    def __init__(self, id_block_size=TASK_ID_BLOCK_SIZE,
+                 task_cache=TASK_CACHE_ENABLED, kdf=None):
+        self.id_block_size = id_block_size
+        self.task_cache = TTLCache(TASK_CACHE_SIZE, TASK_CACHE_TTL) \
+            if task_cache else None
+        self._task_cache_generation = 0
+        self._seen_task_changes = None
+        self._id_lock = threading.Lock()
+        self._reset_task_id_block()
+        # verified passwords are kept only as keyed digests, never in plain text
+        self._credential_key = os.urandom(32)
+        self.kdf = kdf or KDFExecutor()
+        self.verified_credentials = TTLCache(CREDENTIAL_CACHE_SIZE,
+                                             CREDENTIAL_CACHE_TTL)
+
+    @abc.abstractmethod
+    def retrieve_tasks(self, done=None, fields=None, after=None, limit=None,
+                       batch_size=None, q=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def search_tasks(self, q, done=None, fields=None, after=None, limit=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def retrieve_task_with_title(self, title):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def retrieve_task_with_id(self, id_):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def update_task_fields(self, id_, changes, version=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def remove_task(self, task):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def remove_task_by_id(self, id_):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_task_to_db(self, task):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def retrieve_task_changes(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def retrieve_task_stats(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def insert_new_task(self, task):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def reserve_task_ids(self, count):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def apply_task_operations(self, operations, ordered=True):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def listen_for_task_changes(self, logger=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def ping(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def insert_user_to_db(self, user_info):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def retrieve_users(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def retrieve_user_by_username(self, username):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def retrieve_password_hash_for_user(self, username):
+        raise NotImplementedError
+
+    def find_and_update_task(self, task):
+        changes = dict((key, value) for key, value in task.items() if key != 'id')
+        updated_task = self.update_task_fields(task['id'], changes)
+        if updated_task is None:
+            raise ValueError("Task was not updated")
+        return updated_task
+
+    def _read_through(self, key, load):
+        value = self.task_cache.get(key, _MISSING)
+        if value is _MISSING:
+            generation = self._task_cache_generation
+            value = load()
+            # a write that raced with the load must not be hidden by it
+            if generation == self._task_cache_generation:
+                self.task_cache.set(key, value)
+        return value
+
+    def invalidate_task_cache(self, ids=None):
+        if self.task_cache is None:
+            return
+        self._task_cache_generation += 1
+        if ids is None:
+            self.task_cache.clear()
+        else:
+            ids = set(ids)
+            self.task_cache.discard_where(
+                lambda key: key[0] == 'tasks' or key[1] in ids)
+
+    def next_task_id(self):
+        with self._id_lock:
+            if self._id_pid != os.getpid() or self._next_id > self._last_id:
+                self._id_pid = os.getpid()
+                self._next_id = self.reserve_task_ids(self.id_block_size)
+                self._last_id = self._next_id + self.id_block_size - 1
+            id_ = self._next_id
+            self._next_id += 1
+            return id_
+
+    def _reset_task_id_block(self):
+        self._id_pid = os.getpid()
+        self._next_id = 1
+        self._last_id = 0
+
+    def create_non_existing_user_to_database(self, username, password):
+        hash_ = self.kdf.run(bcrypt.hashpw, password.encode('utf-8'),
+                             bcrypt.gensalt(self.encryption_rounds))
+        user_info = {'username': username, 'hash': hash_}
+        user = self.retrieve_user_by_username(username)
+        if not user:
+            self.insert_user_to_db(user_info)
+            self.invalidate_credentials(username)
+
+    def check_password_hash_for_user(self, username, password):
+        # the stored hash is part of the key, so a password changed or a user
+        # removed by another worker stops matching at once; the lookup is an
+        # indexed read, the bcrypt check is what the cache saves
+        hash_ = self.retrieve_password_hash_for_user(username)
+        if hash_ is None:
+            return False
+        key = (username, self._credential_digest(hash_, password))
+        if self.verified_credentials.get(key):
+            return True
+        verified = self.kdf.run(bcrypt.checkpw, password.encode('utf-8'), hash_)
+        if verified:
+            self.verified_credentials.set(key, True)
+        return verified
+
+    def invalidate_credentials(self, username):
+        self.verified_credentials.discard_where(lambda key: key[0] == username)
+
+    def _credential_digest(self, hash_, password):
+        return hmac.new(self._credential_key,
+                        hash_ + b'\0' + password.encode('utf-8'),
+                        hashlib.sha256).digest()
+
+
+_MISSING = object()
+
+
+def _check_version(task, version):
+    if task is not None and version is not None and \
+            task.get('version', 0) != version:
+        raise VersionConflictError("Task was changed by someone else")
+    return task
+
+
+def _task_stats(total, done):
+    return {'total': total, 'done': done, 'open': total - done}
+
+
+def _counts_are_fresh(changes):
+    if changes is None or not changes.get('counted'):
+        return False
+    counted_at = changes.get('counted_at')
+    if counted_at is None:
+        return False
+    if counted_at.tzinfo is None:
+        counted_at = counted_at.replace(tzinfo=timezone.utc)
+    return _now() - counted_at < timedelta(seconds=TASK_STATS_RECOUNT_INTERVAL)
+
+
+def _now():
+    # Mongo keeps millisecond precision, HTTP dates keep whole seconds
+    return datetime.now(timezone.utc).replace(microsecond=0)
@@ -6,9 +6,11 @@ import unittest
 import base64
 import json
 
-from app import app
+from app import TEST_CONFIG, create_app
 from database import TestDB
 
+app = create_app(TEST_CONFIG)
+
 task1 = {
         'id': 1,
         'title': u'Buy groceries',
@@ -70,11 +72,68 @@ class TestApp(unittest.TestCase):
         self.assertEqual(json_resp['task']['title'], 'Read a book')
         self.assertEqual(self.db.tasks.count(), 3)
 
+    def test_when_task_with_duplicate_title_is_created_new_task_is_returned(self):
+        task = '{"title":"Learn Python"}'
+        response = self.app.post('/todo/api/v1.0/tasks',
+                                 data=task,
+                                 content_type='application/json',
+                                 headers={'Authorization': 'Basic ' + self.valid_credentials})
+        json_resp = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(json_resp['task']['title'], 'Learn Python')
+        self.assertFalse(json_resp['task']['uri'].endswith('/tasks/2'))
+        self.assertEqual(self.db.tasks.count(), 3)
+
+    def test_unchanged_task_is_not_sent_again(self):
+        headers = {'Authorization': 'Basic ' + self.valid_credentials}
+        response = self.app.get('/todo/api/v1.0/tasks/2', headers=headers)
+        headers['If-None-Match'] = response.headers['ETag']
+        response = self.app.get('/todo/api/v1.0/tasks/2', headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    def test_task_tag_differs_per_host(self):
+        headers = {'Authorization': 'Basic ' + self.valid_credentials}
+        tags = [self.app.get('/todo/api/v1.0/tasks/2', headers=headers,
+                             base_url=host).headers['ETag']
+                for host in ('http://localhost', 'http://api.example.com')]
+        self.assertNotEqual(tags[0], tags[1])
+
+    def test_changed_task_is_sent_again(self):
+        headers = {'Authorization': 'Basic ' + self.valid_credentials}
+        response = self.app.get('/todo/api/v1.0/tasks/2', headers=headers)
+        self.db.update_task_fields(2, {'done': True})
+        headers['If-None-Match'] = response.headers['ETag']
+        response = self.app.get('/todo/api/v1.0/tasks/2', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response.headers)
+
+    def test_unchanged_task_list_is_not_sent_again_until_a_task_changes(self):
+        headers = {'Authorization': 'Basic ' + self.valid_credentials}
+        response = self.app.get('/todo/api/v1.0/tasks', headers=headers)
+        self.assertIn('Accept', response.headers['Vary'])
+        headers['If-None-Match'] = response.headers['ETag']
+        response = self.app.get('/todo/api/v1.0/tasks', headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('Accept', response.headers['Vary'])
+        self.db.remove_task_by_id(1)
+        response = self.app.get('/todo/api/v1.0/tasks', headers=headers)
+        self.assertEqual(response.status_code, 200)
+
     def test_when_non_existing_task_is_requested_status_code_is_404(self):
         response = self.app.get(
             '/todo/api/v1.0/tasks/5', headers={'Authorization': 'Basic ' + self.valid_credentials})
         self.assertEqual(response.status_code, 404)
 
+    def test_task_id_beyond_int64_is_not_a_task_route(self):
+        headers = {'Authorization': 'Basic ' + self.valid_credentials}
+        for method in (self.app.get, self.app.put, self.app.delete):
+            # answered like any other id that is not a number
+            response = method('/todo/api/v1.0/tasks/%d' % 2 ** 63, headers=headers)
+            self.assertEqual(response.status_code,
+                             method('/todo/api/v1.0/tasks/x', headers=headers).status_code)
+        response = self.app.get('/todo/api/v1.0/tasks/%d' % 2 ** 63, headers=headers)
+        self.assertEqual(response.status_code, 404)
+
     def test_when_task_is_deleted_it_cannot_be_found(self):
         self.app.delete(
             '/todo/api/v1.0/tasks/1', headers={'Authorization': 'Basic ' + self.valid_credentials})
@@ -84,6 +143,50 @@ class TestApp(unittest.TestCase):
         self.assertEqual(self.db.retrieve_task_with_id(1), None)
         self.assertEqual(self.db.tasks.count(), 1)
 
+    def test_when_non_existing_task_is_deleted_status_code_is_404(self):
+        response = self.app.delete(
+            '/todo/api/v1.0/tasks/5', headers={'Authorization': 'Basic ' + self.valid_credentials})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.db.tasks.count(), 2)
+
+    def test_tasks_are_paginated_with_next_link(self):
+        response = self.app.get(
+            '/todo/api/v1.0/tasks?limit=1', headers={'Authorization': 'Basic ' + self.valid_credentials})
+        json_resp = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([task['title'] for task in json_resp['tasks']], ['Buy groceries'])
+        response = self.app.get(
+            json_resp['next'], headers={'Authorization': 'Basic ' + self.valid_credentials})
+        json_resp = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([task['title'] for task in json_resp['tasks']], ['Learn Python'])
+        self.assertNotIn('next', json_resp)
+
+    def test_tasks_are_filtered_by_done_and_projected_to_fields(self):
+        self.db.tasks.update_one({'id': 2}, {'$set': {'done': True}})
+        response = self.app.get(
+            '/todo/api/v1.0/tasks?done=false&fields=title',
+            headers={'Authorization': 'Basic ' + self.valid_credentials})
+        json_resp = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(json_resp['tasks']), 1)
+        self.assertEqual(sorted(json_resp['tasks'][0]), ['title', 'uri'])
+
+    def test_tasks_are_streamed_as_ndjson(self):
+        for headers, query in (({'Accept': 'application/x-ndjson'}, ''),
+                               ({}, '?stream=1')):
+            headers['Authorization'] = 'Basic ' + self.valid_credentials
+            response = self.app.get('/todo/api/v1.0/tasks' + query, headers=headers)
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+            self.assertIn('Accept', response.headers['Vary'])
+            lines = response.data.decode('utf-8').splitlines()
+            self.assertEqual([json.loads(line)['title'] for line in lines],
+                             ['Buy groceries', 'Learn Python'])
+
+    def test_when_listing_arguments_are_invalid_status_code_is_400(self):
+        for query in ('limit=0', 'limit=x', 'after=x', 'after=%d' % 2 ** 63,
+                      'done=1', 'fields=secret'):
+            response = self.app.get(
+                '/todo/api/v1.0/tasks?' + query, headers={'Authorization': 'Basic ' + self.valid_credentials})
+            self.assertEqual(response.status_code, 400)
+
     def test_when_new_task_is_created_without_title_status_code_is_400(self):
         task = '{"description":"fake_news"}'
         response = self.app.post('/todo/api/v1.0/tasks',
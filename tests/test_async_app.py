@@ -0,0 +1,122 @@
+# run instructions: pip install nosetests quart motor
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import unittest
+import base64
+import json
+from unittest import mock
+
+from pymongo import errors
+
+try:
+    import async_app
+    from async_database import AsyncTestDB
+except ImportError as error:
+    # quart and motor are only needed for the ASGI variant
+    raise unittest.SkipTest('async app cannot be imported: %s' % error)
+
+task1 = {
+        'id': 1,
+        'title': u'Buy groceries',
+        'description': u'Milk, Cheese, Pizza, Fruit, Tylenol',
+        'done': False
+    }
+task2 = {
+        'id': 2,
+        'title': u'Learn Python',
+        'description': u'Need to find a good Python tutorial on the web',
+        'done': False
+    }
+
+
+class TestAsyncApp(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = async_app.db = AsyncTestDB()
+        await self.db.create_indexes()
+        await self.db.create_test_users_to_test_db()
+        await self.db.tasks.insert_many([dict(task1), dict(task2)])
+        self.app = async_app.app.test_client()
+        self.valid_credentials = base64.b64encode(b'mojo:python').decode('utf-8')
+        self.invalid_password = base64.b64encode(b'mojo:fake').decode('utf-8')
+        self.headers = {'Authorization': 'Basic ' + self.valid_credentials}
+
+    async def asyncTearDown(self):
+        await self.db.tasks.delete_many({})
+        await self.db.remove_test_users_from_db()
+
+    async def test_all_tasks_are_retrieved(self):
+        response = await self.app.get('/todo/api/v1.0/tasks', headers=self.headers)
+        json_resp = await response.get_json()
+        self.assertEqual([task['title'] for task in json_resp['tasks']],
+                         ['Buy groceries', 'Learn Python'])
+        # the same URL also answers ndjson, depending on Accept
+        self.assertIn('Accept', response.headers['Vary'])
+
+    async def test_when_invalid_password_is_entered_status_code_is_403(self):
+        response = await self.app.get(
+            '/todo/api/v1.0/tasks/2', headers={'Authorization': 'Basic ' + self.invalid_password})
+        self.assertEqual(response.status_code, 403)
+
+    async def test_token_issued_for_valid_credentials_grants_access(self):
+        response = await self.app.post('/todo/api/v1.0/tokens', headers=self.headers)
+        token = (await response.get_json())['token']
+        response = await self.app.get('/todo/api/v1.0/tasks/1',
+                                      headers={'Authorization': 'Bearer ' + token})
+        self.assertEqual(response.status_code, 200)
+
+    async def test_when_non_existing_task_is_requested_status_code_is_404(self):
+        response = await self.app.get('/todo/api/v1.0/tasks/5', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(await response.get_json(), {'error': 'Not found'})
+
+    async def test_when_new_task_is_created_it_can_be_retrieved(self):
+        response = await self.app.post('/todo/api/v1.0/tasks',
+                                       data=json.dumps({'title': 'Read a book'}),
+                                       headers=dict(self.headers, **{'Content-Type': 'application/json'}))
+        self.assertEqual(response.status_code, 201)
+        uri = (await response.get_json())['task']['uri']
+        response = await self.app.get(uri, headers=self.headers)
+        self.assertEqual((await response.get_json())['task']['title'], 'Read a book')
+
+    async def test_when_task_is_updated_it_is_changed(self):
+        response = await self.app.put('/todo/api/v1.0/tasks/2',
+                                      data=json.dumps({'done': True}),
+                                      headers=dict(self.headers, **{'Content-Type': 'application/json'}))
+        self.assertTrue((await response.get_json())['task']['done'])
+        self.assertTrue((await self.db.retrieve_task_with_id(2))['done'])
+
+    async def test_stats_count_done_and_open_tasks(self):
+        await self.db.rebuild_task_stats()
+        await self.app.put('/todo/api/v1.0/tasks/2', data=json.dumps({'done': True}),
+                           headers=dict(self.headers, **{'Content-Type': 'application/json'}))
+        response = await self.app.get('/todo/api/v1.0/tasks/stats', headers=self.headers)
+        self.assertEqual((await response.get_json())['stats'],
+                         {'total': 2, 'done': 1, 'open': 1})
+
+    async def test_tasks_are_searched_by_text(self):
+        response = await self.app.get('/todo/api/v1.0/tasks?q=python', headers=self.headers)
+        self.assertEqual([task['title'] for task in (await response.get_json())['tasks']],
+                         ['Learn Python'])
+
+    async def test_when_task_is_deleted_it_cannot_be_found(self):
+        await self.app.delete('/todo/api/v1.0/tasks/1', headers=self.headers)
+        response = await self.app.get('/todo/api/v1.0/tasks/1', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_ready_only_while_database_answers(self):
+        response = await self.app.get('/readyz')
+        self.assertEqual((response.status_code, (await response.get_json())['status']),
+                         (200, 'ready'))
+        with mock.patch.object(AsyncTestDB, 'client',
+                               new_callable=mock.PropertyMock) as client:
+            client.return_value.admin.command = mock.AsyncMock(
+                side_effect=errors.ServerSelectionTimeoutError('no servers'))
+            response = await self.app.get('/readyz')
+            self.assertEqual(response.status_code, 503)
+            response = await self.app.get('/healthz')
+            self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
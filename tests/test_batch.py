@@ -0,0 +1,139 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import unittest
+import base64
+import json
+
+from app import TEST_CONFIG, create_app
+from database import TestDB
+
+app = create_app(TEST_CONFIG)
+
+task1 = {
+        'id': 1,
+        'title': u'Buy groceries',
+        'description': u'Milk, Cheese, Pizza, Fruit, Tylenol',
+        'done': False
+    }
+task2 = {
+        'id': 2,
+        'title': u'Learn Python',
+        'description': u'Need to find a good Python tutorial on the web',
+        'done': False
+    }
+
+test_db = TestDB()
+
+
+class RacingDB(TestDB):
+    # lets another worker write between the batch's read and its write
+    race = None
+
+    def _plan_task_operations(self, *args):
+        plan = super(RacingDB, self)._plan_task_operations(*args)
+        if self.race is not None:
+            self.race(TestDB())
+        return plan
+
+
+class TestBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        test_db.create_test_users_to_test_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        test_db.remove_test_users_from_db()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        self.valid_credentials = base64.b64encode(b'mojo:python').decode('utf-8')
+        self.db = test_db
+        self.db.tasks.insert(task1)
+        self.db.tasks.insert(task2)
+
+    def tearDown(self):
+        self.db.tasks.remove({})
+
+    def post_batch(self, batch):
+        return self.app.post('/todo/api/v1.0/tasks:batch',
+                             data=json.dumps(batch),
+                             content_type='application/json',
+                             headers={'Authorization': 'Basic ' + self.valid_credentials})
+
+    def test_batch_creates_updates_and_deletes_tasks(self):
+        response = self.post_batch({'operations': [
+            {'op': 'create', 'task': {'title': 'Read a book'}},
+            {'op': 'update', 'id': 2, 'changes': {'done': True}},
+            {'op': 'delete', 'id': 1}]})
+        results = json.loads(response.data.decode('utf-8'))['results']
+        self.assertEqual([result['status'] for result in results], [201, 200, 200])
+        self.assertEqual(results[0]['task']['title'], 'Read a book')
+        self.assertTrue(self.db.retrieve_task_with_id(2)['done'])
+        self.assertIsNone(self.db.retrieve_task_with_id(1))
+        self.assertEqual(self.db.tasks.count(), 2)
+
+    def test_ordered_batch_stops_at_first_failure(self):
+        response = self.post_batch({'operations': [
+            {'op': 'delete', 'id': 5},
+            {'op': 'delete', 'id': 1}]})
+        results = json.loads(response.data.decode('utf-8'))['results']
+        self.assertEqual([result['status'] for result in results], [404, 424])
+        self.assertEqual(self.db.tasks.count(), 2)
+
+    def test_unordered_batch_applies_remaining_operations(self):
+        response = self.post_batch({'ordered': False, 'operations': [
+            {'op': 'update', 'id': 2, 'version': 7, 'changes': {'done': True}},
+            {'op': 'delete', 'id': 1}]})
+        results = json.loads(response.data.decode('utf-8'))['results']
+        self.assertEqual([result['status'] for result in results], [409, 200])
+        self.assertFalse(self.db.retrieve_task_with_id(2)['done'])
+        self.assertEqual(self.db.tasks.count(), 1)
+
+    def test_task_created_by_one_batch_can_be_updated_by_the_next(self):
+        response = self.post_batch({'operations': [
+            {'op': 'create', 'task': {'title': 'Read a book'}}]})
+        task_id = int(json.loads(response.data.decode('utf-8'))['results'][0]
+                      ['task']['uri'].rsplit('/', 1)[1])
+        response = self.post_batch({'operations': [
+            {'op': 'update', 'id': task_id, 'changes': {'done': True}}]})
+        results = json.loads(response.data.decode('utf-8'))['results']
+        self.assertTrue(results[0]['task']['done'])
+        self.assertEqual(results[0]['task']['version'], 1)
+
+    def test_task_changed_after_it_was_read_is_reported_as_conflict(self):
+        db = RacingDB()
+        db.race = lambda other: other.update_task_fields(1, {'title': u'Other'})
+        results = db.apply_task_operations([
+            {'op': 'update', 'id': 1, 'changes': {'done': True}},
+            {'op': 'delete', 'id': 1},
+            {'op': 'update', 'id': 2, 'changes': {'done': True}}], ordered=False)
+        self.assertEqual([result['status'] for result in results], [409, 409, 200])
+        task = self.db.retrieve_task_with_id(1)
+        self.assertEqual((task['title'], task['done']), (u'Other', False))
+        self.assertEqual(db.retrieve_task_stats(), {'total': 2, 'done': 1, 'open': 1})
+
+    def test_task_removed_after_it_was_read_is_counted_once(self):
+        db = RacingDB()
+        db.rebuild_task_stats()
+        db.race = lambda other: other.remove_task_by_id(2)
+        results = db.apply_task_operations([{'op': 'delete', 'id': 2}])
+        self.assertEqual(results, [{'status': 200}])
+        self.assertEqual(db.retrieve_task_stats(), {'total': 1, 'done': 0, 'open': 1})
+
+    def test_when_batch_is_not_an_object_status_code_is_400(self):
+        for batch in ([1], [], 'operations', None):
+            self.assertEqual(self.post_batch(batch).status_code, 400)
+
+    def test_when_batch_operation_is_malformed_status_code_is_400(self):
+        for op in ({'op': 'update', 'id': 'x'}, {'op': 'delete', 'id': 2 ** 63}):
+            response = self.post_batch({'operations': [op]})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.db.tasks.count(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
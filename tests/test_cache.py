@@ -0,0 +1,57 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import unittest
+
+from cache import TTLCache
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=2, ttl=10, clock=self.clock)
+
+    def test_stored_value_is_returned_and_counted_as_hit(self):
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 0)
+
+    def test_missing_value_is_counted_as_miss(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_expired_value_is_not_returned(self):
+        self.cache.set('a', 1)
+        self.clock.now = 11
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_value_is_evicted_when_full(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_matching_keys_are_discarded(self):
+        self.cache.set(('mojo', 1), True)
+        self.cache.set(('kojo', 1), True)
+        self.cache.discard_where(lambda key: key[0] == 'mojo')
+        self.assertIsNone(self.cache.get(('mojo', 1)))
+        self.assertTrue(self.cache.get(('kojo', 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
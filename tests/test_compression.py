@@ -0,0 +1,99 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import unittest
+import base64
+import gzip
+import json
+import zlib
+
+from app import TEST_CONFIG, create_app
+from compression import GzipEncoder, brotli
+from database import TestDB
+
+app = create_app(TEST_CONFIG)
+
+test_db = TestDB()
+
+
+class TestCompression(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        test_db.create_test_users_to_test_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        test_db.remove_test_users_from_db()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        self.headers = {'Authorization': 'Basic ' +
+                        base64.b64encode(b'mojo:python').decode('utf-8')}
+        self.db = test_db
+        for id_ in range(1, 51):
+            self.db.tasks.insert({'id': id_, 'title': u'Task %d' % id_,
+                                  'description': u'Something to do',
+                                  'done': False})
+
+    def tearDown(self):
+        self.db.tasks.remove({})
+
+    def get(self, path, **headers):
+        headers.update(self.headers)
+        return self.app.get('/todo/api/v1.0/' + path, headers=headers)
+
+    def test_listing_is_gzipped_when_accepted(self):
+        plain = self.get('tasks')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        response = self.get('tasks', **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(int(response.headers['Content-Length']),
+                         len(response.data))
+        self.assertLess(len(response.data), len(plain.data))
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+
+    def test_small_responses_are_sent_as_they_are(self):
+        response = self.get('tasks/1', **{'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['task']['title'],
+                         u'Task 1')
+
+    def test_refused_encoding_is_not_used(self):
+        response = self.get('tasks', **{'Accept-Encoding': 'gzip;q=0, identity'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_stream_is_compressed_incrementally(self):
+        response = self.get('tasks?stream=1', **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        lines = gzip.decompress(response.data).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 50)
+        self.assertEqual(json.loads(lines[-1])['title'], u'Task 50')
+
+    def test_compressed_listing_revalidates_with_weak_tag(self):
+        response = self.get('tasks', **{'Accept-Encoding': 'gzip'})
+        self.assertTrue(response.headers['ETag'].startswith('W/'))
+        response = self.get('tasks', **{'Accept-Encoding': 'gzip',
+                                        'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli_is_preferred_when_accepted(self):
+        plain = self.get('tasks')
+        response = self.get('tasks', **{'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.data), plain.data)
+
+    def test_flushed_chunks_decode_as_they_arrive(self):
+        encoder = GzipEncoder(6)
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data = encoder.compress(b'{"title":"Task 1"}\n') + encoder.flush()
+        self.assertEqual(decoder.decompress(data), b'{"title":"Task 1"}\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import unittest
+
+from connection import PoolStatistics, client_options_from_env, get_client
+
+
+class TestConnection(unittest.TestCase):
+    def test_client_options_are_read_from_environment(self):
+        options = client_options_from_env({'MONGO_MAX_POOL_SIZE': '50',
+                                           'MONGO_READ_PREFERENCE': 'secondaryPreferred',
+                                           'MONGO_WRITE_CONCERN': 'majority',
+                                           'MONGO_MIN_POOL_SIZE': ''})
+        self.assertEqual(options, {'maxPoolSize': 50,
+                                   'readPreference': 'secondaryPreferred',
+                                   'w': 'majority'})
+
+    def test_numeric_write_concern_is_an_integer(self):
+        self.assertEqual(client_options_from_env({'MONGO_WRITE_CONCERN': '2'}), {'w': 2})
+
+    def test_client_is_shared_within_process(self):
+        self.assertIs(get_client(), get_client())
+
+    def test_pool_statistics_track_checked_out_connections(self):
+        statistics = PoolStatistics()
+        statistics.connection_created(None)
+        statistics.connection_checked_out(None)
+        statistics.connection_checked_out(None)
+        statistics.connection_checked_in(None)
+        self.assertEqual(statistics.as_dict(), {'connections': 1,
+                                                'checked_out': 1,
+                                                'max_checked_out': 2,
+                                                'check_outs': 2,
+                                                'check_out_failures': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
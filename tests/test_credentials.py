@@ -2,11 +2,13 @@
 # cd /restful_api_with_mongo_db
 # nosetests tests/
 
-from app import app
+from app import TEST_CONFIG, create_app
 import unittest
 import base64
 from database import TestDB
 
+app = create_app(TEST_CONFIG)
+
 task1 = {
         'id': 1,
         'title': u'Buy groceries',
@@ -3,9 +3,15 @@
 # nosetests tests/
 
 import unittest
+from unittest import mock
 
-from app import app
+from pymongo import errors
+
+from app import TEST_CONFIG, create_app
 from database import TestDB
+from storage import VersionConflictError
+
+app = create_app(TEST_CONFIG)
 
 TEST_PASSWORD = "test_password123"
 TEST_USER = "test_user"
@@ -25,6 +31,55 @@ task2 = {
 
 test_db = TestDB()
 
+
+class ChangeStream(object):
+    # mongomock has no change streams; replays events, an exception among
+    # them is raised where it stands
+    def __init__(self, events):
+        self.events = events
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __iter__(self):
+        for position, event in enumerate(self.events):
+            if isinstance(event, Exception):
+                raise event
+            self.resume_token = {'_data': position}
+            yield event
+
+
+class WatchableCollection(object):
+    def __init__(self, db):
+        self.db = db
+
+    def __getattr__(self, name):
+        return getattr(self.db.db.tasks, name)
+
+    def watch(self, **kwargs):
+        self.db.watched.append(kwargs)
+        streams = self.db.streams
+        if len(self.db.watched) >= len(streams):
+            # the last scripted stream, the listener stops after it
+            self.db.stop_listening()
+        return ChangeStream(streams[len(self.db.watched) - 1])
+
+
+class ChangeStreamDB(TestDB):
+    streams = ()
+
+    def __init__(self, **kwargs):
+        super(ChangeStreamDB, self).__init__(**kwargs)
+        self.watched = []
+
+    @property
+    def tasks(self):
+        return WatchableCollection(self)
+
 class TestApp(unittest.TestCase):
     def setUp(self):
         app.config['TESTING'] = True
@@ -63,6 +118,16 @@ class TestApp(unittest.TestCase):
         self.assertEqual(updated_task['title'], 'I am awesome')
         self.assertEqual(updated_task['description'], 'Me hungry')
 
+    def test_updated_task_is_returned_with_new_version(self):
+        updated_task = self.db.update_task_fields(2, {'done': True})
+        self.assertEqual(updated_task['done'], True)
+        self.assertEqual(updated_task['version'], 1)
+        self.assertNotIn('_id', updated_task)
+
+    def test_when_nothing_changes_version_is_not_increased(self):
+        task = self.db.update_task_fields(2, {'done': False})
+        self.assertNotIn('version', task)
+
     def test_when_task_with_invalid_id_is_tried_to_be_updated_error_is_raised(self):
         task = {'id': 6, 'done': True, 'title': 'I dont exist',
                 'description': 'Oh my gosh'}
@@ -85,6 +150,29 @@ class TestApp(unittest.TestCase):
         self.assertEqual(self.db.retrieve_task_with_id(1), None)
         self.assertEqual(self.db.tasks.count(), 1)
 
+    def test_when_task_id_already_exists_task_is_not_added(self):
+        task = {'id': 2, 'done': False, 'title': 'Duplicate',
+                'description': 'Same id as Learn Python'}
+        self.assertRaises(errors.DuplicateKeyError, self.db.add_task_to_db, task)
+        self.assertEqual(self.db.tasks.count(), 2)
+
+    def test_new_task_gets_id_after_existing_tasks(self):
+        task = self.db.insert_new_task({'title': 'New', 'description': '', 'done': False})
+        self.assertGreater(task['id'], 2)
+        self.assertEqual(self.db.retrieve_task_with_id(task['id'])['title'], 'New')
+
+    def test_new_task_can_be_added_to_empty_collection(self):
+        self.db.tasks.remove({})
+        task = self.db.insert_new_task({'title': 'First', 'description': '', 'done': False})
+        self.assertEqual(self.db.retrieve_task_with_id(task['id'])['title'], 'First')
+
+    def test_reserved_id_blocks_do_not_overlap(self):
+        other_db = TestDB()
+        other_db.id_block_size = self.db.id_block_size = 10
+        ids = [self.db.next_task_id() for _ in range(15)] + \
+              [other_db.next_task_id() for _ in range(15)]
+        self.assertEqual(len(set(ids)), 30)
+
     def test_matching_hash_is_found_from_db(self):
         self.db.create_non_existing_user_to_database(TEST_USER, TEST_PASSWORD)
         self.assertTrue(self.db.check_password_hash_for_user(TEST_USER, TEST_PASSWORD))
@@ -93,11 +181,41 @@ class TestApp(unittest.TestCase):
         self.db.create_non_existing_user_to_database(TEST_USER, TEST_PASSWORD)
         self.assertFalse(self.db.check_password_hash_for_user(TEST_USER, "incorrect_password"))
 
+    def test_repeated_password_check_is_served_from_cache(self):
+        self.db.create_non_existing_user_to_database(TEST_USER, TEST_PASSWORD)
+        self.db.check_password_hash_for_user(TEST_USER, TEST_PASSWORD)
+        hits = self.db.verified_credentials.hits
+        self.assertTrue(self.db.check_password_hash_for_user(TEST_USER, TEST_PASSWORD))
+        self.assertEqual(self.db.verified_credentials.hits, hits + 1)
+
+    def test_cached_password_is_forgotten_when_user_is_recreated(self):
+        self.db.create_non_existing_user_to_database(TEST_USER, TEST_PASSWORD)
+        self.db.check_password_hash_for_user(TEST_USER, TEST_PASSWORD)
+        self.db.users.remove({})
+        self.db.create_non_existing_user_to_database(TEST_USER, "new_password")
+        self.assertFalse(self.db.check_password_hash_for_user(TEST_USER, TEST_PASSWORD))
+
+    def test_cached_password_is_forgotten_by_other_workers(self):
+        self.db.create_non_existing_user_to_database(TEST_USER, TEST_PASSWORD)
+        self.db.check_password_hash_for_user(TEST_USER, TEST_PASSWORD)
+        other_db = TestDB()  # another worker, its own credential cache
+        other_db.users.remove({})
+        self.assertFalse(self.db.check_password_hash_for_user(TEST_USER, TEST_PASSWORD))
+        other_db.create_non_existing_user_to_database(TEST_USER, "new_password")
+        self.assertFalse(self.db.check_password_hash_for_user(TEST_USER, TEST_PASSWORD))
+        self.assertTrue(self.db.check_password_hash_for_user(TEST_USER, "new_password"))
+
     def test_single_user_is_retrieved_from_db(self):
         self.db.create_non_existing_user_to_database(TEST_USER, TEST_PASSWORD)
         user = self.db.retrieve_user_by_username(TEST_USER)
         self.assertEqual(user['username'], TEST_USER)
 
+    def test_only_password_hash_is_retrieved_for_user(self):
+        self.db.create_non_existing_user_to_database(TEST_USER, TEST_PASSWORD)
+        hash_ = self.db.retrieve_password_hash_for_user(TEST_USER)
+        self.assertEqual(hash_, self.db.retrieve_user_by_username(TEST_USER)['hash'])
+        self.assertIsNone(self.db.retrieve_password_hash_for_user("nobody"))
+
     def test_when_user_exists_already_it_is_not_created(self):
         self.db.create_non_existing_user_to_database(TEST_USER, TEST_PASSWORD)
         self.db.create_non_existing_user_to_database(TEST_USER, TEST_PASSWORD)
@@ -109,3 +227,68 @@ class TestApp(unittest.TestCase):
 
 
 
+
+
+class TestTaskCache(unittest.TestCase):
+    def setUp(self):
+        self.db = TestDB(task_cache=True)
+        self.db.tasks.insert(task1)
+        self.db.tasks.insert(task2)
+
+    def tearDown(self):
+        self.db.tasks.remove({})
+
+    def test_repeated_task_read_is_served_from_cache(self):
+        self.db.retrieve_task_with_id(2)
+        self.db.tasks.remove({'id': 2})  # behind the cache's back
+        self.assertEqual(self.db.retrieve_task_with_id(2)['title'], 'Learn Python')
+        self.assertEqual(self.db.task_cache.hits, 1)
+
+    def test_cached_task_is_invalidated_when_it_is_updated(self):
+        self.db.retrieve_task_with_id(2)
+        self.db.update_task_fields(2, {'done': True})
+        self.assertTrue(self.db.retrieve_task_with_id(2)['done'])
+
+    def test_cached_page_is_invalidated_when_task_is_removed(self):
+        self.assertEqual(len(self.db.retrieve_tasks(limit=5)), 2)
+        self.db.remove_task_by_id(1)
+        self.assertEqual(len(self.db.retrieve_tasks(limit=5)), 1)
+
+    def test_cache_is_dropped_when_another_worker_changes_tasks(self):
+        self.db.retrieve_task_changes()
+        self.db.retrieve_task_with_id(2)
+        TestDB().update_task_fields(2, {'done': True})
+        self.db.retrieve_task_changes()
+        self.assertTrue(self.db.retrieve_task_with_id(2)['done'])
+
+    def test_stale_cached_copy_does_not_hide_version_conflict(self):
+        self.db.retrieve_task_with_id(2)
+        TestDB().update_task_fields(2, {'done': True})  # another worker
+        self.assertRaises(VersionConflictError, self.db.update_task_fields,
+                          2, {'done': True}, 0)
+
+    def test_change_stream_listener_invalidates_changed_task(self):
+        db = ChangeStreamDB(task_cache=True)
+        db.retrieve_task_with_id(1)
+        db.retrieve_task_with_id(2)
+        db.streams = [[{'operationType': 'update', 'fullDocument': dict(task2)}]]
+        db.listen_for_task_changes().join(5)
+        db.tasks.remove({'id': 2})  # would still be served if not invalidated
+        self.assertIsNone(db.retrieve_task_with_id(2))
+        self.assertEqual(db.task_cache.hits, 0)
+
+    def test_change_stream_listener_resumes_after_an_error(self):
+        db = ChangeStreamDB(task_cache=True)
+        update = {'operationType': 'update', 'fullDocument': dict(task2)}
+        db.streams = [[update, errors.AutoReconnect('primary stepped down')],
+                      [update]]
+        with mock.patch('database.TASK_LISTENER_RETRY_DELAY', 0), \
+                self.assertLogs('database', 'WARNING') as logs:
+            db.retrieve_task_with_id(1)
+            db.listen_for_task_changes().join(5)
+        self.assertIn('primary stepped down', logs.output[0])
+        self.assertEqual([watch['resume_after'] for watch in db.watched],
+                         [None, {'_data': 0}])
+        # whatever changed while the stream was down is read again
+        db.tasks.remove({'id': 1})
+        self.assertIsNone(db.retrieve_task_with_id(1))
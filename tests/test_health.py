@@ -0,0 +1,99 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import unittest
+import json
+
+import app as app_module
+from memory_database import MemoryDatabaseHelper
+from storage import BACKENDS, create_storage
+
+app_module.create_app(app_module.TEST_CONFIG)
+
+
+class UnreachableDB(MemoryDatabaseHelper):
+    def ping(self):
+        return False
+
+
+class TestHealth(unittest.TestCase):
+    def setUp(self):
+        app_module.app.config['TESTING'] = True
+        self.app = app_module.app.test_client()
+
+    def get_status(self, path):
+        response = self.app.get(path)
+        return response.status_code, json.loads(response.data.decode('utf-8'))['status']
+
+    def test_health_needs_no_credentials(self):
+        self.assertEqual(self.get_status('/healthz'), (200, 'ok'))
+
+    def test_ready_when_database_answers(self):
+        self.assertEqual(self.get_status('/readyz'), (200, 'ready'))
+
+    def test_not_ready_when_database_does_not_answer(self):
+        original_db = app_module.db
+        app_module.db = UnreachableDB('test')
+        try:
+            self.assertEqual(self.get_status('/readyz'), (503, 'unavailable'))
+            self.assertEqual(self.get_status('/healthz'), (200, 'ok'))
+        finally:
+            app_module.db = original_db
+
+    def test_health_checks_are_not_shed(self):
+        limiter = app_module.limiter
+        for _ in range(limiter.max_concurrent):
+            limiter._slots.acquire()
+        try:
+            self.assertEqual(self.app.get('/todo/api/v1.0/tasks').status_code, 503)
+            self.assertEqual(self.get_status('/healthz'), (200, 'ok'))
+            self.assertEqual(self.get_status('/readyz'), (200, 'ready'))
+        finally:
+            for _ in range(limiter.max_concurrent):
+                limiter._slots.release()
+
+
+class TestCreateApp(unittest.TestCase):
+    def tearDown(self):
+        app_module.create_app(app_module.TEST_CONFIG)
+
+    def test_storage_follows_configuration(self):
+        app = app_module.create_app({'STORAGE_BACKEND': 'memory',
+                                     'STORAGE_OPTIONS': {'database_name': 'test'}})
+        self.assertIs(app, app_module.app)
+        # nothing is opened until the storage is first used
+        self.assertIsNone(app_module._storage)
+        self.assertIsInstance(app_module.get_storage(), MemoryDatabaseHelper)
+        self.assertEqual(app_module.db.database_name, 'test')
+
+    def test_id_block_size_is_a_storage_option(self):
+        app_module.create_app({'STORAGE_BACKEND': 'memory',
+                               'STORAGE_OPTIONS': {'id_block_size': 100}})
+        first = app_module.db.next_task_id()
+        self.assertEqual(app_module.db.id_block_size, 100)
+        self.assertEqual(app_module.db._last_id, first + 99)
+        self.assertEqual(app_module.config_from_env()['STORAGE_OPTIONS']['id_block_size'],
+                         app_module.TASK_ID_BLOCK_SIZE)
+
+    def test_only_tests_get_the_test_database(self):
+        app = app_module.create_app(app_module.config_from_env())
+        self.assertNotEqual(app.config['STORAGE_BACKEND'], 'test')
+        self.assertEqual(app.config['STORAGE_OPTIONS']['database_name'],
+                         app_module.config_from_env()['STORAGE_OPTIONS']['database_name'])
+
+    def test_every_backend_takes_the_configured_options(self):
+        options = app_module.config_from_env()['STORAGE_OPTIONS']
+        for backend in BACKENDS:
+            storage = create_storage(backend, **options)
+            self.assertEqual(storage.id_block_size, options['id_block_size'])
+        self.assertEqual(create_storage('test', **options).database_name, 'test')
+
+    def test_configuration_comes_from_environment_for_servers(self):
+        config = app_module.config_from_env()
+        self.assertEqual(set(config), set(app_module.TEST_CONFIG))
+        self.assertTrue(config['STORAGE_OPTIONS']['database_name'])
+
+
+if __name__ == '__main__':
+    unittest.main()
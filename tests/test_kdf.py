@@ -0,0 +1,70 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import unittest
+import base64
+import threading
+
+import app as app_module
+from kdf import KDFExecutor, KDFOverloadedError
+
+app_module.create_app(app_module.TEST_CONFIG)
+
+
+class TestKDFExecutor(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.executor = KDFExecutor(threads=1, queue_depth=1, retry_after=3)
+
+    def tearDown(self):
+        self.release.set()
+
+    def test_result_of_function_is_returned(self):
+        self.assertEqual(self.executor.run(pow, 2, 10), 1024)
+        self.assertEqual(self.executor.statistics()['completed'], 1)
+
+    def test_when_queue_is_full_work_is_rejected(self):
+        self.executor.submit(self.release.wait)
+        self.executor.submit(self.release.wait)
+        with self.assertRaises(KDFOverloadedError) as context:
+            self.executor.submit(self.release.wait)
+        self.assertEqual(context.exception.retry_after, 3)
+        self.assertEqual(self.executor.statistics()['rejected'], 1)
+
+    def test_slots_are_freed_when_work_finishes(self):
+        self.executor.run(pow, 2, 2)
+        self.executor.run(pow, 2, 2)
+        self.executor.run(pow, 2, 2)
+        self.assertEqual(self.executor.statistics()['rejected'], 0)
+
+
+class TestKDFBackpressure(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.saturated = KDFExecutor(threads=1, queue_depth=0, retry_after=2)
+        self.saturated.submit(self.release.wait)
+        self.original = app_module.db.kdf
+        app_module.db.kdf = self.saturated
+        app_module.db.verified_credentials.clear()
+        app_module.app.config['TESTING'] = True
+        self.app = app_module.app.test_client()
+
+    def tearDown(self):
+        self.release.set()
+        app_module.db.kdf = self.original
+
+    def test_when_kdf_is_saturated_status_code_is_503_with_retry_after(self):
+        credentials = base64.b64encode(b'mojo:python').decode('utf-8')
+        app_module.db.users.insert_one({'username': 'mojo', 'hash': b'$2b$04$' + b'x' * 53})
+        try:
+            response = self.app.get('/todo/api/v1.0/tasks/1',
+                                    headers={'Authorization': 'Basic ' + credentials})
+        finally:
+            app_module.db.users.delete_many({})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '2')
+
+
+if __name__ == '__main__':
+    unittest.main()
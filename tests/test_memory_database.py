@@ -0,0 +1,177 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import base64
+import inspect
+import json
+import unittest
+
+import app as app_module
+from database import DatabaseHelper
+from memory_database import MemoryDatabaseHelper, TaskRecord
+from storage import Storage, VersionConflictError, create_storage
+
+app_module.create_app(app_module.TEST_CONFIG)
+
+task1 = {
+        'id': 1,
+        'title': u'Buy groceries',
+        'description': u'Milk, Cheese, Pizza, Fruit, Tylenol',
+        'done': False
+    }
+task2 = {
+        'id': 2,
+        'title': u'Learn Python',
+        'description': u'Need to find a good Python tutorial on the web',
+        'done': True
+    }
+
+
+class TestMemoryDatabase(unittest.TestCase):
+    def setUp(self):
+        self.db = MemoryDatabaseHelper('test')
+        self.db.add_task_to_db(dict(task1))
+        self.db.add_task_to_db(dict(task2))
+
+    def test_task_is_found_by_id_and_title(self):
+        self.assertEqual(self.db.retrieve_task_with_id(1), task1)
+        self.assertEqual(self.db.retrieve_task_with_title(u'Learn Python'), task2)
+        self.assertIsNone(self.db.retrieve_task_with_id(3))
+
+    def test_returned_task_is_a_copy(self):
+        self.db.retrieve_task_with_id(1)['title'] = u'Changed'
+        self.assertEqual(self.db.retrieve_task_with_id(1)['title'], task1['title'])
+
+    def test_tasks_are_paged_in_id_order(self):
+        self.db.add_task_to_db({'id': 10, 'title': u'Later', 'done': False})
+        tasks = self.db.retrieve_tasks(after=1, limit=2)
+        self.assertEqual([task['id'] for task in tasks], [2, 10])
+        tasks = self.db.retrieve_tasks(done=False, fields=['title'])
+        self.assertEqual(tasks, [{'id': 1, 'title': u'Buy groceries'},
+                                 {'id': 10, 'title': u'Later'}])
+
+    def test_duplicate_id_is_rejected(self):
+        self.assertRaises(ValueError, self.db.add_task_to_db, dict(task1))
+
+    def test_new_task_gets_id_after_existing_tasks(self):
+        task = self.db.insert_new_task({'title': u'New', 'description': u'',
+                                        'done': False})
+        self.assertEqual(task['id'], 3)
+        self.assertEqual(self.db.retrieve_task_with_id(3)['version'], 0)
+
+    def test_update_moves_title_index_and_bumps_version(self):
+        task = self.db.update_task_fields(1, {'title': u'Buy milk'})
+        self.assertEqual(task['version'], 1)
+        self.assertIsNone(self.db.retrieve_task_with_title(u'Buy groceries'))
+        self.assertEqual(self.db.retrieve_task_with_title(u'Buy milk')['id'], 1)
+
+    def test_unchanged_update_keeps_version(self):
+        changes_before = self.db.retrieve_task_changes()
+        task = self.db.update_task_fields(1, {'done': False})
+        self.assertNotIn('version', task)
+        self.assertEqual(self.db.retrieve_task_changes(), changes_before)
+
+    def test_stale_version_is_rejected(self):
+        self.db.update_task_fields(1, {'done': True})
+        self.assertRaises(VersionConflictError, self.db.update_task_fields,
+                          1, {'done': False}, 0)
+
+    def test_removed_task_cannot_be_found(self):
+        self.assertTrue(self.db.remove_task_by_id(1))
+        self.assertFalse(self.db.remove_task_by_id(1))
+        self.assertIsNone(self.db.retrieve_task_with_title(task1['title']))
+        self.assertEqual([task['id'] for task in self.db.retrieve_tasks()], [2])
+
+    def test_batch_reports_each_operation(self):
+        results = self.db.apply_task_operations([
+            {'op': 'create', 'task': {'title': u'New', 'description': u'',
+                                      'done': False}},
+            {'op': 'update', 'id': 2, 'changes': {'done': False}},
+            {'op': 'delete', 'id': 5},
+            {'op': 'delete', 'id': 1}])
+        self.assertEqual([result['status'] for result in results],
+                         [201, 200, 404, 424])
+        self.assertEqual(results[0]['task']['id'], 3)
+        self.assertIsNotNone(self.db.retrieve_task_with_id(1))
+
+    def test_stats_follow_writes(self):
+        self.assertEqual(self.db.retrieve_task_stats(),
+                         {'total': 2, 'done': 1, 'open': 1})
+        self.db.update_task_fields(1, {'done': True})
+        self.db.remove_task_by_id(2)
+        self.assertEqual(self.db.retrieve_task_stats(),
+                         {'total': 1, 'done': 1, 'open': 0})
+
+    def test_search_follows_updates(self):
+        self.db.update_task_fields(1, {'title': u'Learn Go'})
+        tasks = self.db.retrieve_tasks(q=u'learn', fields=['title'])
+        self.assertEqual(tasks, [{'id': 1, 'title': u'Learn Go'},
+                                 {'id': 2, 'title': u'Learn Python'}])
+        self.db.remove_task_by_id(2)
+        self.assertEqual(self.db.search_tasks(u'python'), [])
+
+    def test_password_is_checked_against_stored_hash(self):
+        self.db.create_non_existing_user_to_database('mojo', 'python')
+        self.assertTrue(self.db.check_password_hash_for_user('mojo', 'python'))
+        self.assertFalse(self.db.check_password_hash_for_user('mojo', 'java'))
+        self.assertFalse(self.db.check_password_hash_for_user('nobody', 'python'))
+
+    def test_record_has_no_instance_dict(self):
+        self.assertFalse(hasattr(TaskRecord(task1), '__dict__'))
+
+
+class TestStorageRegistry(unittest.TestCase):
+    def test_backend_is_chosen_by_name(self):
+        self.assertIsInstance(create_storage('memory'), MemoryDatabaseHelper)
+        self.assertIsInstance(create_storage('mongo', database_name='test',
+                                             task_cache=False), DatabaseHelper)
+
+    def test_unknown_backend_is_rejected(self):
+        self.assertRaises(ValueError, create_storage, 'cassandra')
+
+    def test_incomplete_backend_cannot_be_created(self):
+        class HalfBackend(Storage):
+            def retrieve_tasks(self, done=None, fields=None, after=None,
+                               limit=None, batch_size=None, q=None):
+                return []
+
+        self.assertRaises(TypeError, HalfBackend)
+
+    def test_backends_take_every_argument_of_the_interface(self):
+        for name, method in vars(Storage).items():
+            if not inspect.isfunction(method) or name == '__init__':
+                continue
+            expected = list(inspect.signature(method).parameters)
+            for backend in (DatabaseHelper, MemoryDatabaseHelper):
+                self.assertEqual(
+                    list(inspect.signature(getattr(backend, name)).parameters),
+                    expected, '%s.%s' % (backend.__name__, name))
+
+
+class TestAppOnMemoryDatabase(unittest.TestCase):
+    def setUp(self):
+        self.original_db = app_module.db
+        app_module.db = MemoryDatabaseHelper('test')
+        app_module.db.create_non_existing_user_to_database('mojo', 'python')
+        app_module.db.add_task_to_db(dict(task1))
+        app_module.app.config['TESTING'] = True
+        self.app = app_module.app.test_client()
+        credentials = base64.b64encode(b'mojo:python').decode('utf-8')
+        self.headers = {'Authorization': 'Basic ' + credentials}
+
+    def tearDown(self):
+        app_module.db = self.original_db
+
+    def test_task_can_be_created_and_listed(self):
+        response = self.app.post('/todo/api/v1.0/tasks', headers=self.headers,
+                                 data=json.dumps({'title': u'Read'}),
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        response = self.app.get('/todo/api/v1.0/tasks', headers=self.headers)
+        titles = [task['title'] for task in json.loads(response.data)['tasks']]
+        self.assertEqual(titles, [u'Buy groceries', u'Read'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import unittest
+import base64
+
+from app import TEST_CONFIG, create_app
+from database import TestDB
+from metrics import Histogram, Metrics, describe, metrics
+
+app = create_app(TEST_CONFIG)
+
+task1 = {
+        'id': 1,
+        'title': u'Buy groceries',
+        'description': u'Milk, Cheese, Pizza, Fruit, Tylenol',
+        'done': False
+    }
+
+test_db = TestDB()
+
+
+class FakeCommandEvent(object):
+    command_name = 'find'
+    duration_micros = 1500
+
+
+class TestHistogram(unittest.TestCase):
+    def test_observations_are_rendered_as_cumulative_buckets(self):
+        histogram = Histogram('latency_seconds', 'Latency.', ('route',), (0.1, 1.0))
+        histogram.observe(0.05, '/tasks')
+        histogram.observe(0.5, '/tasks')
+        histogram.observe(5, '/tasks')
+        self.assertEqual(histogram.render()[2:], [
+            'latency_seconds_bucket{route="/tasks",le="0.1"} 1',
+            'latency_seconds_bucket{route="/tasks",le="1.0"} 2',
+            'latency_seconds_bucket{route="/tasks",le="+Inf"} 3',
+            'latency_seconds_sum{route="/tasks"} 5.55',
+            'latency_seconds_count{route="/tasks"} 3'])
+
+
+class TestMetrics(unittest.TestCase):
+    def test_mongo_commands_are_attributed_to_current_request(self):
+        collected = Metrics(enabled=True)
+        collected.start_request()
+        collected.command_listener.succeeded(FakeCommandEvent())
+        collected.command_listener.succeeded(FakeCommandEvent())
+        duration, operations = collected.finish_request('/tasks', 'GET', 200)
+        self.assertEqual(describe(operations), 'mongo:find x2 0.003s')
+        self.assertIn('todo_mongo_operations_per_request_count{route="/tasks",method="GET"} 1',
+                      collected.render())
+
+    def test_nothing_is_recorded_when_disabled(self):
+        collected = Metrics(enabled=False)
+        collected.record('kdf', 0.25)
+        self.assertNotIn('todo_kdf_duration_seconds_count', collected.render())
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        test_db.create_test_users_to_test_db()
+        test_db.tasks.insert(task1)
+
+    @classmethod
+    def tearDownClass(cls):
+        test_db.remove_test_users_from_db()
+        test_db.tasks.remove({})
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        self.valid_credentials = base64.b64encode(b'mojo:python').decode('utf-8')
+
+    def tearDown(self):
+        metrics.enabled = False
+
+    def test_metrics_endpoint_is_hidden_unless_enabled(self):
+        self.assertEqual(self.app.get('/metrics').status_code, 404)
+
+    def test_route_latency_is_exported(self):
+        metrics.enabled = True
+        self.app.get('/todo/api/v1.0/tasks/1',
+                     headers={'Authorization': 'Basic ' + self.valid_credentials})
+        body = self.app.get('/metrics').data.decode('utf-8')
+        self.assertIn('todo_request_duration_seconds_count{route="/todo/api/v1.0/tasks/<int:task_id>",'
+                      'method="GET",status="200"}', body)
+        self.assertIn('todo_serialization_duration_seconds_count', body)
+        self.assertIn('todo_kdf_completed', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import unittest
+import base64
+import json
+
+from flask import Flask, jsonify
+
+import app as app_module
+from database import TestDB
+from ratelimit import Limiter, MemoryBucketStore, MongoBucketStore, \
+    OverloadedError, RateLimitedError, TokenBucket
+
+app_module.create_app(app_module.TEST_CONFIG)
+
+test_db = TestDB()
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def bucket(self, store):
+        return TokenBucket('test', 2, 3, store, clock=self.clock)
+
+    def assert_burst_then_refill(self, bucket):
+        for _ in range(3):
+            bucket.acquire('mojo')
+        with self.assertRaises(RateLimitedError) as context:
+            bucket.acquire('mojo')
+        self.assertEqual(context.exception.retry_after, 1)
+        # other keys have their own bucket
+        bucket.acquire('other')
+        self.clock.now += 0.5
+        bucket.acquire('mojo')
+        self.assertRaises(RateLimitedError, bucket.acquire, 'mojo')
+
+    def test_burst_is_allowed_then_tokens_come_back_at_the_rate(self):
+        self.assert_burst_then_refill(self.bucket(MemoryBucketStore()))
+
+    def test_shared_store_behaves_the_same(self):
+        store = MongoBucketStore('test')
+        collection = store.collection
+        collection.delete_many({})
+        self.assert_burst_then_refill(self.bucket(store))
+        self.assertEqual(collection.count_documents({}), 2)
+        collection.delete_many({})
+
+    def test_idle_bucket_does_not_save_up_beyond_burst(self):
+        bucket = self.bucket(MemoryBucketStore())
+        bucket.acquire('mojo')
+        self.clock.now += 60
+        for _ in range(3):
+            bucket.acquire('mojo')
+        self.assertRaises(RateLimitedError, bucket.acquire, 'mojo')
+
+
+class TestRateLimitedApp(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        test_db.create_test_users_to_test_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        test_db.remove_test_users_from_db()
+
+    def setUp(self):
+        app_module.app.config['TESTING'] = True
+        app_module.app.config['RATE_LIMIT_ENABLED'] = True
+        app_module.limiter.store._buckets.clear()
+        self.app = app_module.app.test_client()
+        self.headers = {'Authorization': 'Basic ' +
+                        base64.b64encode(b'mojo:python').decode('utf-8')}
+
+    def tearDown(self):
+        app_module.app.config['RATE_LIMIT_ENABLED'] = False
+
+    def test_token_route_answers_429_with_retry_after(self):
+        rate, burst = app_module.TOKEN_RATE_LIMIT
+        for _ in range(burst):
+            response = self.app.post('/todo/api/v1.0/tokens', headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+        rate_limited = app_module.limiter.statistics()['rate_limited']
+        response = self.app.post('/todo/api/v1.0/tokens', headers=self.headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(json.loads(response.data.decode('utf-8')),
+                         {'error': 'Too many requests'})
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+        self.assertEqual(app_module.limiter.statistics()['rate_limited'],
+                         rate_limited + 1)
+        # the route's own bucket leaves the shared one alone
+        response = self.app.get('/todo/api/v1.0/tasks', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_ip_buckets_follow_forwarded_addresses_from_trusted_proxies(self):
+        original_bucket = app_module.limiter.ip_bucket
+        app_module.limiter.ip_bucket = TokenBucket('ip', 1, 2,
+                                                   app_module.limiter.store)
+        app_module.create_app({'RATE_LIMIT_ENABLED': True,
+                               'IP_RATE_LIMIT_ENABLED': True, 'TRUSTED_PROXIES': 1})
+        try:
+            def get(address):
+                headers = dict(self.headers, **{'X-Forwarded-For': address})
+                return self.app.get('/todo/api/v1.0/tasks/stats',
+                                    headers=headers).status_code
+            self.assertEqual([get('10.0.0.1') for _ in range(3)], [200, 200, 429])
+            self.assertEqual(get('10.0.0.2'), 200)
+        finally:
+            app_module.limiter.ip_bucket = original_bucket
+            app_module.create_app(app_module.TEST_CONFIG)
+
+    def test_ip_buckets_are_off_unless_enabled(self):
+        self.assertFalse(app_module.app.config['IP_RATE_LIMIT_ENABLED'])
+        original_bucket = app_module.limiter.ip_bucket
+        app_module.limiter.ip_bucket = TokenBucket('ip', 1, 1,
+                                                   app_module.limiter.store)
+        try:
+            for _ in range(3):
+                response = self.app.get('/todo/api/v1.0/tasks/stats',
+                                        headers=self.headers)
+                self.assertEqual(response.status_code, 200)
+        finally:
+            app_module.limiter.ip_bucket = original_bucket
+
+    def test_disabled_limiter_lets_everything_through(self):
+        app_module.app.config['RATE_LIMIT_ENABLED'] = False
+        rate, burst = app_module.TOKEN_RATE_LIMIT
+        for _ in range(burst + 1):
+            response = self.app.post('/todo/api/v1.0/tokens', headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+
+
+class TestAdmissionControl(unittest.TestCase):
+    def setUp(self):
+        self.flask_app = Flask(__name__)
+        self.limiter = Limiter(lambda: 'mojo', max_concurrent=2)
+        self.limiter.init_app(self.flask_app)
+
+        @self.flask_app.errorhandler(OverloadedError)
+        def shed(error):
+            return jsonify({'error': 'Service unavailable'}), 503
+
+        @self.flask_app.route('/')
+        def index():
+            return jsonify(self.limiter.statistics())
+
+        self.app = self.flask_app.test_client()
+
+    def test_requests_beyond_the_cap_are_shed(self):
+        response = self.app.get('/')
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['in_flight'], 1)
+        # two requests already in progress elsewhere
+        self.limiter._slots.acquire()
+        self.limiter._slots.acquire()
+        self.assertEqual(self.app.get('/').status_code, 503)
+        self.limiter._slots.release()
+        self.limiter._slots.release()
+        self.assertEqual(self.app.get('/').status_code, 200)
+        statistics = self.limiter.statistics()
+        self.assertEqual((statistics['in_flight'], statistics['shed']), (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import unittest
+import base64
+import json
+
+from app import TEST_CONFIG, create_app
+from database import TestDB
+from search import InvertedIndex, rank
+
+app = create_app(TEST_CONFIG)
+
+tasks = [
+    {'id': 1, 'title': u'Buy groceries', 'description': u'Milk, Cheese, Pizza',
+     'done': False},
+    {'id': 2, 'title': u'Learn Python', 'description': u'Find a good Python tutorial',
+     'done': False},
+    {'id': 3, 'title': u'Pizza night', 'description': u'Order pizza for everyone',
+     'done': True},
+    {'id': 4, 'title': u'Read about Python', 'description': u'', 'done': False},
+]
+
+test_db = TestDB()
+
+
+class TestInvertedIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = InvertedIndex()
+        for task in tasks:
+            self.index.add(task['id'], task)
+
+    def test_terms_are_scored_by_occurrences(self):
+        self.assertEqual(self.index.search(u'pizza'), {1: 1, 3: 2})
+        self.assertEqual(self.index.search(u'PYTHON milk'), {1: 1, 2: 2, 4: 1})
+
+    def test_excluded_terms_drop_tasks(self):
+        self.assertEqual(self.index.search(u'python -tutorial'), {4: 1})
+
+    def test_removed_task_is_not_found(self):
+        self.index.remove(3)
+        self.assertEqual(self.index.search(u'pizza'), {1: 1})
+        self.assertEqual(len(self.index), 3)
+
+    def test_ranking_pages_after_a_task(self):
+        scores = {1: 1, 2: 2, 4: 1}
+        self.assertEqual(rank(scores), [2, 1, 4])
+        self.assertEqual(rank(scores, after=2, limit=1), [1])
+        self.assertEqual(rank(scores, after=3), [])
+
+
+class TestSearch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        test_db.create_test_users_to_test_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        test_db.remove_test_users_from_db()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        self.headers = {'Authorization': 'Basic ' +
+                        base64.b64encode(b'mojo:python').decode('utf-8')}
+        for task in tasks:
+            test_db.tasks.insert(dict(task))
+
+    def tearDown(self):
+        test_db.tasks.remove({})
+
+    def search(self, query):
+        response = self.app.get('/todo/api/v1.0/tasks?' + query, headers=self.headers)
+        return response.status_code, json.loads(response.data.decode('utf-8'))
+
+    def test_results_are_ranked_by_score(self):
+        status, body = self.search('q=pizza')
+        self.assertEqual(status, 200)
+        self.assertEqual([task['title'] for task in body['tasks']],
+                         [u'Pizza night', u'Buy groceries'])
+
+    def test_search_uses_listing_filters_and_projection(self):
+        status, body = self.search('q=python+pizza&done=false&fields=title')
+        self.assertEqual(body['tasks'], [
+            {'uri': 'http://localhost/todo/api/v1.0/tasks/2', 'title': u'Learn Python'},
+            {'uri': 'http://localhost/todo/api/v1.0/tasks/1', 'title': u'Buy groceries'},
+            {'uri': 'http://localhost/todo/api/v1.0/tasks/4', 'title': u'Read about Python'}])
+
+    def test_search_pages_follow_ranking(self):
+        status, body = self.search('q=python&limit=1')
+        self.assertEqual([task['title'] for task in body['tasks']], [u'Learn Python'])
+        response = self.app.get(body['next'], headers=self.headers)
+        body = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([task['title'] for task in body['tasks']], [u'Read about Python'])
+        self.assertNotIn('next', body)
+
+    def test_empty_query_is_rejected(self):
+        status, body = self.search('q=+')
+        self.assertEqual(status, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
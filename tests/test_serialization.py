@@ -0,0 +1,52 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import json
+import unittest
+from datetime import datetime, timezone
+
+from flask import url_for
+
+from app import TEST_CONFIG, create_app, make_public_task
+from serialization import public_task, public_tasks
+
+app = create_app(TEST_CONFIG)
+
+task1 = {
+        'id': 1,
+        'title': u'Buy groceries',
+        'description': u'Milk, Cheese, Pizza, Fruit, Tylenol',
+        'done': False,
+        'version': 2,
+        'updated_at': datetime(2020, 1, 1, tzinfo=timezone.utc)
+    }
+
+
+class TestSerialization(unittest.TestCase):
+    def test_public_task_has_uri_instead_of_id(self):
+        self.assertEqual(public_task(task1, 'http://localhost/tasks/'),
+                         {'uri': 'http://localhost/tasks/1',
+                          'title': u'Buy groceries',
+                          'description': u'Milk, Cheese, Pizza, Fruit, Tylenol',
+                          'done': False,
+                          'version': 2})
+
+    def test_stored_task_is_not_changed(self):
+        public_tasks([task1], 'http://localhost/tasks/')
+        self.assertEqual(task1['id'], 1)
+        self.assertIn('updated_at', task1)
+
+    def test_uri_prefix_matches_task_route(self):
+        with app.test_request_context('/'):
+            self.assertEqual(make_public_task(task1)['uri'],
+                             url_for('get_task', task_id=1, _external=True))
+
+    def test_responses_round_trip(self):
+        with app.test_request_context('/'):
+            body = {'tasks': [{'title': u'Kafé', 'done': True, 'id': 3}]}
+            self.assertEqual(json.loads(app.json.response(body).get_data()), body)
+
+
+if __name__ == '__main__':
+    unittest.main()
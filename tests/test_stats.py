@@ -0,0 +1,112 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import unittest
+import base64
+import json
+from datetime import datetime
+
+from app import TEST_CONFIG, create_app
+from database import TestDB
+
+app = create_app(TEST_CONFIG)
+
+task1 = {
+        'id': 1,
+        'title': u'Buy groceries',
+        'description': u'Milk, Cheese, Pizza, Fruit, Tylenol',
+        'done': False
+    }
+task2 = {
+        'id': 2,
+        'title': u'Learn Python',
+        'description': u'Need to find a good Python tutorial on the web',
+        'done': True
+    }
+
+test_db = TestDB()
+
+
+class TestStats(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        test_db.create_test_users_to_test_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        test_db.remove_test_users_from_db()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        self.headers = {'Authorization': 'Basic ' +
+                        base64.b64encode(b'mojo:python').decode('utf-8')}
+        self.db = test_db
+        self.db.tasks.insert(task1)
+        self.db.tasks.insert(task2)
+        # the tasks were inserted behind the counts' back
+        self.db.rebuild_task_stats()
+
+    def tearDown(self):
+        self.db.tasks.remove({})
+
+    def get_stats(self):
+        response = self.app.get('/todo/api/v1.0/tasks/stats', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data.decode('utf-8'))['stats']
+
+    def send(self, method, path, data=None):
+        return self.app.open('/todo/api/v1.0/' + path, method=method,
+                             data=json.dumps(data), content_type='application/json',
+                             headers=self.headers)
+
+    def test_done_and_open_tasks_are_counted(self):
+        self.assertEqual(self.get_stats(), {'total': 2, 'done': 1, 'open': 1})
+
+    def test_counts_follow_writes(self):
+        self.send('POST', 'tasks', {'title': u'Read a book'})
+        self.send('PUT', 'tasks/1', {'done': True})
+        self.send('DELETE', 'tasks/2')
+        self.assertEqual(self.get_stats(), {'total': 2, 'done': 1, 'open': 1})
+        self.assertEqual(self.db.count_tasks(), (2, 1))
+
+    def test_unchanged_update_does_not_change_counts(self):
+        self.send('PUT', 'tasks/2', {'done': True})
+        self.assertEqual(self.get_stats(), {'total': 2, 'done': 1, 'open': 1})
+
+    def test_failed_batch_operations_are_not_counted(self):
+        self.send('POST', 'tasks:batch', {'ordered': False, 'operations': [
+            {'op': 'update', 'id': 1, 'changes': {'done': True}},
+            {'op': 'delete', 'id': 7},
+            {'op': 'create', 'task': {'title': u'Read a book'}}]})
+        self.assertEqual(self.get_stats(), {'total': 3, 'done': 2, 'open': 1})
+        self.assertEqual(self.db.count_tasks(), (3, 2))
+
+    def test_counts_are_rebuilt_when_missing(self):
+        self.db.counters.remove({'_id': 'task_changes'})
+        self.assertEqual(self.db.retrieve_task_stats(),
+                         {'total': 2, 'done': 1, 'open': 1})
+        self.assertTrue(self.db.counters.find_one({'_id': 'task_changes'})['counted'])
+
+    def test_write_counted_by_a_rebuild_is_reconciled(self):
+        task = {'id': 3, 'title': u'Read a book', 'description': u'', 'done': True}
+        # a rebuild lands between a task write and its $inc on the counts
+        self.db.tasks.insert_one(task)
+        self.db.rebuild_task_stats()
+        self.db._record_task_change([3], 1, 1)
+        # counted twice until the next recount
+        self.assertEqual(self.get_stats(), {'total': 4, 'done': 3, 'open': 1})
+        # once the counts are older than the recount interval they are redone
+        self.db.counters.update_one({'_id': 'task_changes'},
+                                    {'$set': {'counted_at': datetime(2000, 1, 1)}})
+        self.assertEqual(self.get_stats(), {'total': 3, 'done': 2, 'open': 1})
+        self.assertEqual(self.get_stats(), {'total': 3, 'done': 2, 'open': 1})
+
+    def test_stats_need_authentication(self):
+        response = self.app.get('/todo/api/v1.0/tasks/stats')
+        self.assertEqual(response.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# run instructions: pip install nosetests
+# cd /restful_api_with_mongo_db
+# nosetests tests/
+
+import unittest
+import base64
+import json
+
+from app import TEST_CONFIG, create_app
+from database import TestDB
+from tokens import TokenSigner, keys_from_env
+
+app = create_app(TEST_CONFIG)
+
+task1 = {
+        'id': 1,
+        'title': u'Buy groceries',
+        'description': u'Milk, Cheese, Pizza, Fruit, Tylenol',
+        'done': False
+    }
+
+test_db = TestDB()
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenSigner(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.signer = TokenSigner([('b', b'new secret'), ('a', b'old secret')],
+                                  expiration=60, clock=self.clock)
+
+    def test_signed_token_is_verified(self):
+        self.assertEqual(self.signer.verify(self.signer.sign('mojo')), 'mojo')
+
+    def test_expired_token_is_rejected(self):
+        token = self.signer.sign('mojo')
+        self.clock.now += 61
+        self.assertIsNone(self.signer.verify(token))
+
+    def test_tampered_token_is_rejected(self):
+        payload, signature = self.signer.sign('mojo').split('.')
+        forged = TokenSigner([('b', b'guess')], clock=self.clock).sign('kojo')
+        self.assertIsNone(self.signer.verify(forged.split('.')[0] + '.' + signature))
+        self.assertIsNone(self.signer.verify('garbage'))
+
+    def test_non_ascii_signature_is_rejected(self):
+        payload = self.signer.sign('mojo').split('.')[0]
+        self.assertIsNone(self.signer.verify(payload + u'.\u00e9'))
+
+    def test_token_signed_with_rotated_out_key_is_still_verified(self):
+        old_signer = TokenSigner([('a', b'old secret')], clock=self.clock)
+        self.assertEqual(self.signer.verify(old_signer.sign('mojo')), 'mojo')
+
+    def test_token_signed_with_removed_key_is_rejected(self):
+        old_signer = TokenSigner([('z', b'retired')], clock=self.clock)
+        self.assertIsNone(self.signer.verify(old_signer.sign('mojo')))
+
+    def test_keys_are_read_from_environment(self):
+        self.assertEqual(keys_from_env({'TOKEN_SECRET_KEYS': 'b:new, a:old'}),
+                         [('b', b'new'), ('a', b'old')])
+
+
+class TestTokenLogin(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        test_db.create_test_users_to_test_db()
+        test_db.tasks.insert(task1)
+
+    @classmethod
+    def tearDownClass(cls):
+        test_db.remove_test_users_from_db()
+        test_db.tasks.remove({})
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        self.valid_credentials = base64.b64encode(b'mojo:python').decode('utf-8')
+
+    def test_token_issued_for_valid_credentials_grants_access(self):
+        response = self.app.post('/todo/api/v1.0/tokens',
+                                 headers={'Authorization': 'Basic ' + self.valid_credentials})
+        self.assertEqual(response.status_code, 201)
+        token = json.loads(response.data.decode('utf-8'))['token']
+        response = self.app.get('/todo/api/v1.0/tasks/1',
+                                headers={'Authorization': 'Bearer ' + token})
+        self.assertEqual(response.status_code, 200)
+
+    def test_when_token_is_invalid_status_code_is_403(self):
+        response = self.app.get('/todo/api/v1.0/tasks/1',
+                                headers={'Authorization': 'Bearer invalid.token'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_token_cannot_be_issued_with_a_token(self):
+        response = self.app.post('/todo/api/v1.0/tokens',
+                                 headers={'Authorization': 'Bearer invalid.token'})
+        self.assertEqual(response.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,9 +6,11 @@ import unittest
 import base64
 import json
 
-from app import app
+from app import TEST_CONFIG, create_app
 from database import TestDB
 
+app = create_app(TEST_CONFIG)
+
 task1 = {
         'id': 1,
         'title': u'Buy groceries',
@@ -56,6 +58,33 @@ class TestApp(unittest.TestCase):
         task_in_db = self.db.retrieve_task_with_title('Learn Python')
         self.assertTrue(task_in_db['done'])
 
+    def test_when_task_is_updated_with_current_version_it_is_changed(self):
+        update = '{"title": "Learn Flask", "version": 0}'
+        response = self.app.put('todo/api/v1.0/tasks/2',
+                                data=update,
+                                content_type='application/json',
+                                headers={'Authorization': 'Basic ' + self.valid_credentials})
+        json_resp = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(json_resp['task']['title'], 'Learn Flask')
+        self.assertEqual(json_resp['task']['version'], 1)
+
+    def test_when_task_is_updated_with_stale_version_error_code_409_is_retrieved(self):
+        update = '{"title": "Learn Flask", "version": 3}'
+        response = self.app.put('todo/api/v1.0/tasks/2',
+                                data=update,
+                                content_type='application/json',
+                                headers={'Authorization': 'Basic ' + self.valid_credentials})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.db.retrieve_task_with_id(2)['title'], 'Learn Python')
+
+    def test_when_non_existing_task_is_updated_error_code_404_is_retrieved(self):
+        update = '{"done": true}'
+        response = self.app.put('todo/api/v1.0/tasks/5',
+                                data=update,
+                                content_type='application/json',
+                                headers={'Authorization': 'Basic ' + self.valid_credentials})
+        self.assertEqual(response.status_code, 404)
+
     def test_when_task_update_is_not_in_json_error_code_400_is_retrieved(self):
         update = '{"done": true}'
         response = self.app.put('todo/api/v1.0/tasks/2',
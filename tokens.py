@@ -0,0 +1,63 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+TOKEN_EXPIRATION = 3600  # seconds
+
+
+def keys_from_env(environ=None):
+    # TOKEN_SECRET_KEYS="2024b:newsecret,2024a:oldsecret", newest first
+    environ = os.environ if environ is None else environ
+    keys = []
+    for entry in environ.get('TOKEN_SECRET_KEYS', '').split(','):
+        if ':' in entry:
+            key_id, secret = entry.split(':', 1)
+            keys.append((key_id.strip(), secret.strip().encode('utf-8')))
+    if not keys:
+        # tokens then only verify in the process that issued them
+        keys.append(('local', os.urandom(32)))
+    return keys
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class TokenSigner(object):
+    def __init__(self, keys=None, expiration=TOKEN_EXPIRATION, clock=time.time):
+        self.keys = keys_from_env() if keys is None else keys
+        self.expiration = expiration
+        self._clock = clock
+
+    def sign(self, username):
+        key_id, secret = self.keys[0]
+        payload = _encode(json.dumps({'u': username, 'k': key_id,
+                                      'exp': int(self._clock()) + self.expiration},
+                                     separators=(',', ':')).encode('utf-8'))
+        return payload + '.' + self._signature(secret, payload)
+
+    def verify(self, token):
+        try:
+            payload, signature = token.split('.')
+            claims = json.loads(_decode(payload).decode('utf-8'))
+            secret = dict(self.keys)[claims['k']]
+        except (ValueError, KeyError, TypeError):
+            return None
+        # compared as bytes: compare_digest refuses str with non-ASCII text
+        if not hmac.compare_digest(signature.encode('utf-8'),
+                                   self._signature(secret, payload).encode('ascii')):
+            return None
+        if claims['exp'] < self._clock():
+            return None
+        return claims['u']
+
+    def _signature(self, secret, payload):
+        return _encode(hmac.new(secret, payload.encode('ascii'),
+                                hashlib.sha256).digest())
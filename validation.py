@@ -0,0 +1,106 @@
+import six
+from werkzeug.exceptions import abort
+from werkzeug.routing import IntegerConverter
+
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_SIZE = 1000
+MAX_QUERY_LENGTH = 200
+TASK_FIELDS = {'title', 'description', 'done'}
+# Mongo keeps integers as signed 64 bit; a larger one cannot even be sent
+# in a query
+MIN_INT64, MAX_INT64 = -2 ** 63, 2 ** 63 - 1
+
+
+def is_int64(value):
+    return type(value) is int and MIN_INT64 <= value <= MAX_INT64
+
+
+class Int64Converter(IntegerConverter):
+    # an id Mongo cannot store is a task that does not exist: no route matches
+    def __init__(self, map, *args, **kwargs):
+        kwargs.setdefault('max', MAX_INT64)
+        super(Int64Converter, self).__init__(map, *args, **kwargs)
+
+
+def valid_task_update(data):
+    if 'title' in data and not isinstance(data['title'], six.string_types):
+        return False
+    if 'description' in data and \
+            not isinstance(data['description'], six.string_types):
+        return False
+    if 'done' in data and type(data['done']) is not bool:
+        return False
+    if 'version' in data and not is_int64(data['version']):
+        return False
+    return True
+
+
+def parse_batch_operation(op):
+    if not isinstance(op, dict):
+        abort(400)
+    if op.get('op') == 'create':
+        task = op.get('task')
+        if not isinstance(task, dict) or \
+                not isinstance(task.get('title'), six.string_types) or \
+                not valid_task_update(task):
+            abort(400)
+        return {'op': 'create',
+                'task': {'title': task['title'],
+                         'description': task.get('description', ""),
+                         'done': False}}
+    if op.get('op') not in ('update', 'delete') or not is_int64(op.get('id')):
+        abort(400)
+    if op['op'] == 'delete':
+        return {'op': 'delete', 'id': op['id']}
+    changes = op.get('changes')
+    if not isinstance(changes, dict) or not valid_task_update(changes) or \
+            'version' in changes or not valid_task_update(op):
+        abort(400)
+    return {'op': 'update', 'id': op['id'], 'version': op.get('version'),
+            'changes': dict((field, changes[field])
+                            for field in TASK_FIELDS if field in changes)}
+
+
+def parse_listing_args(args):
+    listing = {}
+    if 'limit' in args:
+        try:
+            listing['limit'] = int(args['limit'])
+        except ValueError:
+            abort(400)
+        if not 0 < listing['limit'] <= MAX_PAGE_SIZE:
+            abort(400)
+    if 'after' in args:
+        try:
+            listing['after'] = int(args['after'])
+        except ValueError:
+            abort(400)
+        if not is_int64(listing['after']):
+            abort(400)
+    if 'done' in args:
+        if args['done'] not in ('true', 'false'):
+            abort(400)
+        listing['done'] = args['done'] == 'true'
+    if 'fields' in args:
+        fields = [field for field in args['fields'].split(',') if field]
+        if not set(fields) <= TASK_FIELDS:
+            abort(400)
+        listing['fields'] = fields
+    if 'q' in args:
+        query = args['q'].strip()
+        if not query or len(query) > MAX_QUERY_LENGTH:
+            abort(400)
+        listing['q'] = query
+    return listing
+
+
+def parse_batch(data):
+    if not isinstance(data, dict) or not isinstance(data.get('operations'), list):
+        abort(400)
+    operations = [parse_batch_operation(op) for op in data['operations']]
+    if not 0 < len(operations) <= MAX_BATCH_SIZE:
+        abort(400)
+    ordered = data.get('ordered', True)
+    if type(ordered) is not bool:
+        abort(400)
+    return operations, ordered
@@ -0,0 +1,12 @@
+# run instructions: pip install gunicorn (or uwsgi)
+# cd /restful_api_with_mongo_db
+# gunicorn -c gunicorn.conf.py wsgi:app
+# uwsgi --master --processes 4 --http :8000 --module wsgi:app
+#
+# Both servers import this module once in the master and fork the workers
+# from it, so Flask, the routes, bcrypt and the JSON encoder are loaded and
+# shared a single time. The storage and its Mongo client are created by
+# each worker on first use, never inherited through fork. Importing app.py
+# configures the app from the environment.
+
+from app import app